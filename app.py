@@ -3,11 +3,43 @@ import folium
 from streamlit_folium import st_folium
 # from streamlit_js_eval import streamlit_js_eval
 
-from utils.routing import generate_map, get_image_ids, evenly_sample, get_image_to_url
+from utils.routing import generate_map, build_base_map, get_image_ids, evenly_sample, get_image_urls, warm_up
+from utils.route_cache import RouteCache
+from utils.prefetch import ImagePrefetcher
+from utils.jobs import RouteRunner
+from utils.graph_store import GRAPH_DIR
+from utils.context import DATASETS
 import math
+import os
+import threading
+from datetime import datetime, timezone
 
-if 'map_obj' not in st.session_state:
-    st.session_state.map_obj = None
+@st.cache_resource
+def start_warm_up():
+    # load the graph and datasets in the background, once per server process;
+    # the (u, v) optimality lookup is only for graphs without the CSR arrays
+    thread = threading.Thread(target=warm_up, args=[name for name in DATASETS if name != 'edge_optimals'], daemon=True)
+    thread.start()
+    return thread
+
+start_warm_up()
+
+@st.cache_resource
+def get_route_cache():
+    # one route cache for all sessions, persisted next to the graph snapshot
+    return RouteCache(maxsize=512, path=os.path.join(GRAPH_DIR, 'routes.sqlite'))
+
+@st.cache_resource
+def get_image_prefetcher():
+    return ImagePrefetcher()
+
+@st.cache_resource
+def get_route_runner():
+    # searches run here, off the script thread, shared by all sessions
+    return RouteRunner()
+
+if 'map_layers' not in st.session_state:
+    st.session_state.map_layers = None
 if 'last_search' not in st.session_state:
     st.session_state.last_search = None
 if 'path_shortest_details' not in st.session_state:
@@ -23,6 +55,61 @@ if 'current_image_index' not in st.session_state:
     st.session_state.current_image_index = 0
 if 'sampled_images' not in st.session_state:
     st.session_state.sampled_images = []
+if 'sampled_image_urls' not in st.session_state:
+    st.session_state.sampled_image_urls = []
+if 'base_map' not in st.session_state:
+    # tiles are built once per session; searches only swap the route layers on top
+    st.session_state.base_map = build_base_map()
+if 'route_options' not in st.session_state:
+    st.session_state.route_options = {}
+if 'route_job' not in st.session_state:
+    st.session_state.route_job = None
+if 'route_error' not in st.session_state:
+    st.session_state.route_error = None
+
+def show_route(name):
+    # the chosen route drives the right-hand metrics and the slideshow, which only
+    # change with the route, so they are worked out once here
+    st.session_state.path_practical, st.session_state.path_practical_details = st.session_state.route_options[name]
+    st.session_state.current_image_index = 0
+    image_ids = evenly_sample(get_image_ids(st.session_state.path_practical), 10)
+    # images without a url have nothing to show, so the slideshow leaves them out
+    images = [(image_id, url) for image_id, url in zip(image_ids, get_image_urls(image_ids)) if url is not None]
+    st.session_state.sampled_images = [image_id for image_id, _ in images]
+    st.session_state.sampled_image_urls = [url for _, url in images]
+    get_image_prefetcher().prefetch(st.session_state.sampled_image_urls[:2] + st.session_state.sampled_image_urls[-1:])
+
+def apply_finished_search():
+    # runs before any widget is drawn, so the route selectbox can be reset here
+    job = st.session_state.route_job
+    if job is None or not job.done():
+        return
+    st.session_state.route_job = None
+
+    try:
+        st.session_state.map_layers, _, path_practical, st.session_state.path_shortest_details, path_practical_details, paths_pareto, paths_pareto_details = job.result()
+    except Exception as e:
+        st.session_state.route_error = f"No route found: {e}"
+        return
+    st.session_state.route_error = None
+    st.session_state.last_search = st.session_state.pending_search
+
+    st.session_state.route_options = {'Optimal Route': (path_practical, path_practical_details)}
+    for i, (path, details) in enumerate(zip(paths_pareto, paths_pareto_details)):
+        st.session_state.route_options[f"Alternative {i + 1}: {round(details['length_m'] / 1000, 1)} km, {details['safety']}"] = (path, details)
+    st.session_state.selected_route = 'Optimal Route'
+    show_route('Optimal Route')
+
+@st.fragment(run_every=0.3)
+def search_progress():
+    job = st.session_state.route_job
+    if job is None:
+        return
+    if job.done():
+        st.rerun()
+    st.progress(job.fraction, text=f"{(job.stage or 'waiting').capitalize()}...")
+
+apply_finished_search()
 
 
 
@@ -80,18 +167,32 @@ with left_col.container(key="left_col"):
     destination = st.text_input("Destination", "", label_visibility="collapsed", key="dest_input")
     
     if st.button("Search", use_container_width=True):
-        with st.spinner("Generating optimal route..."):
-            # if type(source) == str: source = int(source)
-            # if type(destination) == str: destination = int(destination)
+        # if type(source) == str: source = int(source)
+        # if type(destination) == str: destination = int(destination)
+
+        # a new search supersedes one still running; it stops at its next stage
+        if st.session_state.route_job is not None:
+            st.session_state.route_job.cancel()
+        st.session_state.route_job = get_route_runner().submit(
+            generate_map, source, destination, cache=get_route_cache(), alternatives=3, as_layers=True,
+            departure=datetime.now(timezone.utc),
+        )
+        st.session_state.pending_search = (source, destination)
 
-            st.session_state.map_obj, _, st.session_state.path_practical, st.session_state.path_shortest_details, st.session_state.path_practical_details = generate_map(source, destination)
-            st.session_state.last_search = (source, destination)
-            st.session_state.current_image_index = 0
-            st.rerun()
+    if st.session_state.route_job is not None:
+        search_progress()
+    if st.session_state.route_error:
+        st.error(st.session_state.route_error)
+
+    if len(st.session_state.route_options) > 1:
+        st.selectbox(
+            "Route", list(st.session_state.route_options), key="selected_route", label_visibility="collapsed",
+            on_change=lambda: show_route(st.session_state.selected_route),
+        )
 
     shortest_col, practical_col = st.columns(2, gap='small')
     with shortest_col:
-        if st.session_state.map_obj and st.session_state.path_shortest_details:
+        if st.session_state.map_layers and st.session_state.path_shortest_details:
 
             distance_shortest = st.session_state.path_shortest_details['length_m'] / 1000
             time_shortest = distance_shortest / 15 * 60  # assuming average speed of 15 km/h
@@ -102,13 +203,13 @@ with left_col.container(key="left_col"):
             # st.metric("Bike Lane Coverage", "78%")
 
     with practical_col:
-        if st.session_state.map_obj and st.session_state.path_practical_details:
+        if st.session_state.map_layers and st.session_state.path_practical_details:
 
             distance_practical = st.session_state.path_practical_details['length_m'] / 1000
             distance_percent = (distance_practical - distance_shortest) / distance_shortest * 100
             time_practical = distance_practical / 15 * 60  # assuming average speed of 15 km/h
 
-            st.metric('Optimal Route', f"{st.session_state.path_practical_details['safety'].capitalize()}")
+            st.metric(st.session_state.get('selected_route', 'Optimal Route').split(':')[0], f"{st.session_state.path_practical_details['safety'].capitalize()}")
             st.metric("Distance", f'{round(distance_practical, 1)} km', delta=f"+{round(distance_percent, 1)}%")
             # st.metric("Estimated Time", f"{math.floor(time_practical)} min")
             # st.metric("Bike Lane Coverage", "78%")
@@ -116,18 +217,14 @@ with left_col.container(key="left_col"):
     shortest_col, practical_col = st.columns(2, gap='small')
     st.text(' ')
     with shortest_col:
-        if st.session_state.map_obj and st.session_state.path_shortest_details:
+        if st.session_state.map_layers and st.session_state.path_shortest_details:
             st.metric("Estimated Time", f'{math.floor(time_shortest)} min')
     
     with practical_col:
-        if st.session_state.map_obj and st.session_state.path_practical_details:
+        if st.session_state.map_layers and st.session_state.path_practical_details:
             st.metric("Estimated Time", f"{math.floor(time_practical)} min")
 
-    if st.session_state.last_search:
-        path_practical_images = get_image_ids(st.session_state.path_practical)
-        sampled_images = evenly_sample(path_practical_images, 10)
-        st.session_state.sampled_images = sampled_images
-
+    if st.session_state.last_search and st.session_state.sampled_images:
         # st.session_state.street_view_image = get_image_to_url(sampled_images[0])
 
         # # st.image(st.session_state.street_view_image, use_container_width=True, caption="Street View")
@@ -155,8 +252,14 @@ with left_col.container(key="left_col"):
                 st.session_state.current_image_index = st.session_state.current_image_index % len(st.session_state.sampled_images)
                 st.rerun()
         
-        current_image_url = get_image_to_url(st.session_state.sampled_images[st.session_state.current_image_index])
-        st.image(current_image_url, use_container_width=True)
+        # keep the current image and its neighbours downloading so Previous/Next only render
+        image_urls = st.session_state.sampled_image_urls
+        current_index = st.session_state.current_image_index
+        prefetcher = get_image_prefetcher()
+        prefetcher.prefetch([image_urls[(current_index + step) % len(image_urls)] for step in (0, 1, -1)])
+
+        current_image_url = image_urls[current_index]
+        st.image(prefetcher.get(current_image_url) or current_image_url, use_container_width=True)
         
         st.markdown('</div>', unsafe_allow_html=True)
         
@@ -185,9 +288,11 @@ with left_col.container(key="left_col"):
 #     )
 
 with right_col:
-    if st.session_state.map_obj:
+    if st.session_state.map_layers:
         map_data = st_folium(
-            st.session_state.map_obj,
+            st.session_state.base_map,
+            feature_group_to_add=st.session_state.map_layers,
+            layer_control=folium.LayerControl(),
             width=None,
             height=940,
             returned_objects=["last_clicked"],
@@ -229,6 +334,6 @@ with right_col:
         )
         st.info("Enter source and destination, then click Search to generate route")
 
-if st.session_state.map_obj and 'last_clicked' in st.session_state:
+if st.session_state.map_layers and 'last_clicked' in st.session_state:
     clicked_point = st.session_state.last_clicked
     st.write(f"Clicked at: {clicked_point['lat']:.4f}, {clicked_point['lng']:.4f}")
@@ -0,0 +1,109 @@
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import networkx as nx
+
+from benchmarks.synthetic import grid_city, od_pairs
+from utils.corridor import build_node_grid, nodes_in_bbox
+from utils.csr import CSRCorridor, position
+from utils.edge_index import node_positions
+from utils.routing import graph_csr
+from utils.search import build_adjacency, max_avg_path
+
+# corridor extraction as utils.routing.optimal_path_in_corridor does it (node grid
+# lookup, then a CSRCorridor cut out of the CSR arrays) against the node scan and
+# G.subgraph(...).copy() it replaced, including the search on the result. memory
+# is the tracemalloc peak of the extraction alone. run from the repo root:
+#   python -m benchmarks.bench_corridor
+
+
+def corridor_bbox(G, shortest_path, padding=0.20):
+    xs = [G.nodes[n]['x'] for n in shortest_path]
+    ys = [G.nodes[n]['y'] for n in shortest_path]
+    pad_x, pad_y = (max(xs) - min(xs)) * padding, (max(ys) - min(ys)) * padding
+    return min(xs) - pad_x, min(ys) - pad_y, max(xs) + pad_x, max(ys) + pad_y
+
+
+def copied_subgraph(G, bbox):
+    min_x, min_y, max_x, max_y = bbox
+    return G.subgraph(
+        n for n, data in G.nodes(data=True) if min_x <= data['x'] <= max_x and min_y <= data['y'] <= max_y
+    ).copy()
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def run(side, n_pairs):
+    G, optimal_df = grid_city(side)
+    optimal = optimal_df['optimal'].to_dict()
+    nx.set_edge_attributes(
+        G, {(u, v, key): optimal[osmid] for u, v, key, osmid in G.edges(keys=True, data='osmid') if osmid in optimal}, 'optimal',
+    )
+    edge_optimals = {(u, v): value for u, v, value in G.edges(data='optimal') if value is not None}
+
+    start = time.perf_counter()
+    csr = graph_csr(G)
+    node_grid = build_node_grid(csr['nodes'], csr['x'], csr['y'])
+    print(f'grid {side}x{side} ({side * side} nodes): CSR graph and node grid built once in {time.perf_counter() - start:.2f} s')
+
+    def copy_search(bbox, source, dest):
+        adj = build_adjacency(copied_subgraph(G, bbox), edge_optimals)
+        return lambda: max_avg_path(adj, source, dest)
+
+    def csr_search(bbox, source, dest):
+        corridor = CSRCorridor(csr, node_positions(csr, nodes_in_bbox(node_grid, *bbox)))
+        start, end = position(csr, source), position(csr, dest)
+        return lambda: max_avg_path(
+            corridor.adjacency, start, end, dist=corridor.hops_to_target(end), w_max=corridor.w_max,
+        )
+
+    # each extracts a corridor and returns its search
+    extract = {'copy': copy_search, 'csr': csr_search}
+    stats = {name: {'extract': [], 'route': [], 'memory': []} for name in extract}
+    mismatches = 0
+    for source, dest in od_pairs(side, n_pairs, 25, 70):
+        bbox = corridor_bbox(G, nx.shortest_path(G, source, dest))
+        scores = []
+        for name, fn in extract.items():
+            search, seconds = timed(lambda: fn(bbox, source, dest))
+            (_, score), route_seconds = timed(search)
+            stats[name]['extract'].append(seconds)
+            stats[name]['route'].append(seconds + route_seconds)
+            stats[name]['memory'].append(peak_memory(lambda: fn(bbox, source, dest)))
+            scores.append(score)
+        mismatches += not np.isclose(*scores) and scores[0] != scores[1]
+
+    for name, values in stats.items():
+        print(f'  {name:<5} extract median {np.median(values["extract"]) * 1e3:8.2f} ms'
+              f'  extract+search median {np.median(values["route"]) * 1e3:8.1f} ms'
+              f'  extract peak memory median {np.median(values["memory"]) / 2**20:7.2f} MiB')
+    print(f'  {mismatches} of {n_pairs} routes scored differently')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pairs', type=int, default=20)
+    parser.add_argument('--base-side', type=int, default=55)
+    parser.add_argument('--scale', type=int, default=100)
+    args = parser.parse_args()
+
+    for side in (args.base_side, int(args.base_side * args.scale ** 0.5)):
+        run(side, args.pairs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import networkx as nx
+
+from benchmarks.synthetic import grid_city, od_pairs
+from benchmarks.bench_shortest_path import synthetic_edge_weights
+from benchmarks.legacy import CorridorView
+from utils.corridor import build_node_grid, nodes_in_bbox
+from utils.csr import build_csr, csr_nbytes, shortest_hop_path
+from utils.edge_weights import edge_optimal_lookup
+from utils.routing import optimal_path_in_corridor
+from utils.search import build_adjacency, max_avg_path
+
+# the CSR graph in utils/csr.py against the NetworkX graph and dict adjacency the
+# searches used before: memory of each structure, and latency of the fewest-hop
+# shortest path and of the corridor search on the same corridors. memory is what
+# tracemalloc sees allocated by building the structure (the graph's attribute
+# values are shared with G, so the MultiDiGraph figure is a lower bound). run from
+# the repo root:
+#   python -m benchmarks.bench_graph
+
+
+def allocated(build):
+    tracemalloc.start()
+    value = build()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, current
+
+
+def timed(fn, pairs):
+    timings, results = [], []
+    for pair in pairs:
+        start = time.perf_counter()
+        results.append(fn(*pair))
+        timings.append(time.perf_counter() - start)
+    return np.array(timings), results
+
+
+def report(name, timings):
+    print(f'    {name:<28} median {np.median(timings) * 1e3:8.2f} ms  p95 {np.percentile(timings, 95) * 1e3:8.2f} ms')
+
+
+def run(side, n_pairs):
+    G, optimal_df = grid_city(side)
+    edge_weights = synthetic_edge_weights(G, optimal_df)
+    edge_optimals = edge_optimal_lookup(edge_weights)
+    node_ids, xy = zip(*G.nodes(data=True))
+    xs, ys = [d['x'] for d in xy], [d['y'] for d in xy]
+    node_grid = build_node_grid(node_ids, xs, ys)
+
+    _, graph_bytes = allocated(lambda: nx.MultiDiGraph(G))
+    adj, adj_bytes = allocated(lambda: build_adjacency(G, edge_optimals))
+    csr = build_csr(edge_weights, node_ids, xs, ys)
+
+    n_edges = G.number_of_edges()
+    print(f'grid {side}x{side}: {len(G)} nodes, {n_edges} edges')
+    for name, nbytes in (
+        ('MultiDiGraph', graph_bytes),
+        ('dict adjacency', adj_bytes),
+        ('CSR arrays', csr_nbytes(csr)),
+    ):
+        print(f'    {name:<28} {nbytes / 2**20:8.1f} MiB  {nbytes / n_edges:7.1f} B/edge')
+
+    pairs = od_pairs(side, n_pairs, 25, 70)
+    nx_timings, nx_paths = timed(lambda s, d: nx.shortest_path(G, s, d), pairs)
+    csr_timings, csr_paths = timed(lambda s, d: shortest_hop_path(csr, s, d), pairs)
+    print('  fewest-hop shortest path')
+    report('nx.shortest_path', nx_timings)
+    report('CSR bounded breadth-first', csr_timings)
+    print(f'    {sum(len(a) != len(b) for a, b in zip(nx_paths, csr_paths))} of {len(pairs)} paths differ in length')
+
+    # both searches get the corridor of the NetworkX shortest path
+    corridors = {pair: optimal_path_in_corridor(G, *pair, path, 0.20, csr=csr, node_grid=node_grid)[2]
+                 for pair, path in zip(pairs, nx_paths)}
+    dict_timings, dict_results = timed(
+        lambda s, d: max_avg_path(CorridorView(adj, nodes_in_bbox(node_grid, *corridors[s, d])), s, d), pairs
+    )
+    csr_timings, csr_results = timed(
+        lambda s, d: optimal_path_in_corridor(G, s, d, nx_paths[pairs.index((s, d))], 0.20,
+                                              csr=csr, node_grid=node_grid)[:2],
+        pairs,
+    )
+    print('  corridor search (extraction and max_avg_path)')
+    report('dict adjacency view', dict_timings)
+    report('CSR corridor', csr_timings)
+    mismatches = sum(not np.isclose(a[1], b[1]) and a[1] != b[1] for a, b in zip(dict_results, csr_results))
+    print(f'    {mismatches} of {len(pairs)} routes scored differently')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pairs', type=int, default=20)
+    parser.add_argument('--base-side', type=int, default=55)
+    parser.add_argument('--scale', type=int, default=100)
+    args = parser.parse_args()
+
+    for side in (args.base_side, int(args.base_side * args.scale ** 0.5)):
+        run(side, args.pairs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import time
+
+import numpy as np
+import networkx as nx
+from geopy.distance import great_circle
+
+from benchmarks.synthetic import features_city, use_offline_graph
+from utils.context import data
+from utils.routing import get_image_ids
+
+# images-along-a-route lookup: the precomputed image index against the per-call
+# groupby and great_circle sort it replaced, on long routes over a graph rebuilt
+# from the real feature geometries. run from the repo root:
+#   python -m benchmarks.bench_images
+
+
+def legacy_get_image_ids(path):
+    roads_gdf, nodes_gdf, images_matches = data.roads_gdf, data.nodes_gdf, data.images_matches
+
+    def sort_image_ids(image_id, source_osmid):
+        source_coords = (nodes_gdf.loc[source_osmid, 'y'].item(), nodes_gdf.loc[source_osmid, 'x'].item())
+        image_coords = images_matches.loc[image_id, 'geometry'].coords[0][::-1]
+        return great_circle(source_coords, image_coords).meters
+
+    image_ids = []
+    osmid_to_image_id = images_matches.reset_index(drop=False).groupby('osmid').agg({'image_id': list})
+    for source_osmid, dest_osmid in nx.utils.pairwise(path):
+        if (source_osmid, dest_osmid, 0) in roads_gdf.index:
+            edge_osmid = roads_gdf.loc[(source_osmid, dest_osmid, 0), 'osmid']
+        elif (dest_osmid, source_osmid, 0) in roads_gdf.index:
+            edge_osmid = roads_gdf.loc[(dest_osmid, source_osmid, 0), 'osmid']
+        else:
+            continue
+        if edge_osmid in osmid_to_image_id.index:
+            curr_image_ids = osmid_to_image_id.loc[edge_osmid].item()
+            curr_image_ids = sorted(curr_image_ids, key=lambda x: sort_image_ids(x, source_osmid))
+            image_ids.extend([curr_image_ids[0], curr_image_ids[-1]])
+    return image_ids
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--routes', type=int, default=10)
+    args = parser.parse_args()
+
+    G, features = features_city()
+    use_offline_graph(G)
+
+    start = time.perf_counter()
+    data.warm_up('network', 'images_matches', 'image_index')
+    print(f'{len(G)} nodes; network and image index built in {time.perf_counter() - start:.2f} s')
+
+    # the longest shortest paths from a few random nodes
+    rng = np.random.default_rng(0)
+    nodes = list(G.nodes)
+    routes = []
+    for source in rng.choice(nodes, size=args.routes, replace=False):
+        lengths = nx.single_source_shortest_path_length(G, source)
+        routes.append(nx.shortest_path(G, source, max(lengths, key=lengths.get)))
+
+    for name, fn in (('image index', get_image_ids), ('legacy', legacy_get_image_ids)):
+        timings, counts = [], []
+        for path in routes:
+            start = time.perf_counter()
+            counts.append(len(fn(path)))
+            timings.append(time.perf_counter() - start)
+        print(f'  {name:<12} median {np.median(timings) * 1e3:8.2f} ms  max {np.max(timings) * 1e3:8.2f} ms'
+              f'  ({np.mean([len(p) for p in routes]):.0f} nodes/route, {np.mean(counts):.0f} images/route)')
+
+
+if __name__ == '__main__':
+    main()
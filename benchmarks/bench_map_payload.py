@@ -0,0 +1,79 @@
+import argparse
+import time
+
+import numpy as np
+import networkx as nx
+import folium
+
+from benchmarks.synthetic import features_city, use_offline_graph
+from utils.context import data
+from utils.routing import get_route, get_path_rows, build_base_map, build_route_layers
+
+# map payload for a route: one GeoJSON feature per route over a base map built
+# once, against a new map with a folium.PolyLine per edge. sizes are the HTML
+# folium renders (what st_folium ships); 'layers only' is what a rerun ships
+# when the base map is kept and only the route layers change. run from the repo root:
+#   python -m benchmarks.bench_map_payload
+
+
+def legacy_map(route, source, dest):
+    m = build_base_map()
+    folium.LayerControl().add_to(m)
+    nodes_gdf, roads_gdf = data.nodes_gdf, data.roads_gdf
+    for point in (source, dest):
+        folium.CircleMarker(location=(nodes_gdf.loc[point, 'y'], nodes_gdf.loc[point, 'x']), radius=2, color="#4834d4").add_to(m)
+    for path, color in ((route['path_shortest'], '#e74c3c'), (route['path_practical'], '#0984e3')):
+        for geom in roads_gdf.geometry.iloc[get_path_rows(path)]:
+            folium.PolyLine(locations=[(lat, lon) for lon, lat in geom.coords], color=color, weight=5, opacity=0.7).add_to(m)
+    return m
+
+
+def layered_map(route, source, dest):
+    m = build_base_map()
+    for layer in build_route_layers(route, source, dest):
+        layer.add_to(m)
+    folium.LayerControl().add_to(m)
+    return m
+
+
+def rendered(build):
+    start = time.perf_counter()
+    html = build().get_root().render()
+    return len(html.encode()), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--routes', type=int, default=10)
+    args = parser.parse_args()
+
+    G, _ = features_city()
+    use_offline_graph(G)
+    data.warm_up('network', 'node_grid')
+
+    rng = np.random.default_rng(0)
+    base_bytes, _ = rendered(build_base_map)
+    results = {'per-edge PolyLine': [], 'GeoJSON layers': [], 'layers only': []}
+    edges = []
+    for source in rng.choice(list(G.nodes), size=args.routes, replace=False):
+        lengths = nx.single_source_shortest_path_length(G, source)
+        dest = max(lengths, key=lengths.get)
+        try:
+            route = get_route(int(source), int(dest))
+        except ValueError:
+            continue
+        edges.append(len(route['path_shortest']) + len(route['path_practical']) - 2)
+
+        results['per-edge PolyLine'].append(rendered(lambda: legacy_map(route, source, dest)))
+        layered = rendered(lambda: layered_map(route, source, dest))
+        results['GeoJSON layers'].append(layered)
+        results['layers only'].append((layered[0] - base_bytes, layered[1]))
+
+    print(f'{len(edges)} routes, {np.mean(edges):.0f} edges drawn per map; base map alone {base_bytes / 1024:.1f} KB')
+    for name, values in results.items():
+        sizes, seconds = np.array(values).T
+        print(f'  {name:<18} median {np.median(sizes) / 1024:7.1f} KB  build+render median {np.median(seconds) * 1e3:7.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import argparse
+import time
+from collections import deque
+
+import numpy as np
+import networkx as nx
+
+from benchmarks.synthetic import grid_city, od_pairs
+from utils.search import build_adjacency, max_avg_path
+
+# compares the label-setting max-average search against the BFS it replaced.
+# run from the repo root: python -m benchmarks.bench_max_avg
+
+
+def legacy_max_avg(G, edge_optimals, start_node, end_node):
+    best_at_node = {node: (-np.inf, 0, None) for node in G.nodes()}
+    best_at_node[start_node] = (0, 0, [start_node])
+    queue = deque([start_node])
+
+    while queue:
+        current = queue.popleft()
+        current_avg, current_count, current_path = best_at_node[current]
+        for neighbor in G.neighbors(current):
+            if neighbor in current_path:
+                continue
+            edge_opt = edge_optimals.get((current, neighbor), np.nan)
+            new_count = current_count + 1
+            new_avg = (current_avg * current_count + edge_opt) / new_count
+            if new_avg > best_at_node[neighbor][0]:
+                best_at_node[neighbor] = (new_avg, new_count, current_path + [neighbor])
+                queue.append(neighbor)
+
+    return best_at_node[end_node][2], best_at_node[end_node][0]
+
+
+def corridor(G, shortest_path, padding=0.20):
+    xs = [G.nodes[n]['x'] for n in shortest_path]
+    ys = [G.nodes[n]['y'] for n in shortest_path]
+    pad_x, pad_y = (max(xs) - min(xs)) * padding, (max(ys) - min(ys)) * padding
+    min_x, max_x, min_y, max_y = min(xs) - pad_x, max(xs) + pad_x, min(ys) - pad_y, max(ys) + pad_y
+    return G.subgraph(
+        n for n, data in G.nodes(data=True) if min_x <= data['x'] <= max_x and min_y <= data['y'] <= max_y
+    ).copy()
+
+
+def edge_weights(G, optimal):
+    weights = {}
+    for u, v, data in G.edges(data=True):
+        if data['osmid'] in optimal:
+            weights[(u, v)] = optimal[data['osmid']]
+    return weights
+
+
+def run(side, pairs, optimal, G, legacy):
+    timings, legacy_timings, scores, legacy_scores = [], [], [], []
+
+    for source, dest in pairs:
+        shortest = nx.shortest_path(G, source, dest)
+        G_sub = corridor(G, shortest)
+        weights = edge_weights(G_sub, optimal)
+
+        start = time.perf_counter()
+        path, score = max_avg_path(build_adjacency(G_sub, weights), source, dest)
+        timings.append(time.perf_counter() - start)
+        scores.append(score)
+
+        if legacy:
+            start = time.perf_counter()
+            _, legacy_score = legacy_max_avg(G_sub, weights, source, dest)
+            legacy_timings.append(time.perf_counter() - start)
+            legacy_scores.append(legacy_score)
+
+    print(f'grid {side}x{side} ({side * side} nodes), {len(pairs)} routes')
+    print(f'  label-setting  median {np.median(timings) * 1e3:8.1f} ms  p95 {np.percentile(timings, 95) * 1e3:8.1f} ms'
+          f'  mean score {np.mean(np.nan_to_num(scores, neginf=0)):.4f}')
+    if legacy:
+        print(f'  legacy BFS     median {np.median(legacy_timings) * 1e3:8.1f} ms  p95 {np.percentile(legacy_timings, 95) * 1e3:8.1f} ms'
+              f'  mean score {np.mean(np.nan_to_num(legacy_scores, neginf=0)):.4f}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pairs', type=int, default=20)
+    parser.add_argument('--base-side', type=int, default=55)
+    parser.add_argument('--scale', type=int, default=100)
+    parser.add_argument('--skip-legacy', action='store_true')
+    args = parser.parse_args()
+
+    for side in (args.base_side, int(args.base_side * args.scale ** 0.5)):
+        G, optimal_df = grid_city(side)
+        optimal = optimal_df['optimal'].to_dict()
+        # routes of roughly 0.5-1.5 km on the base grid, like a trip across
+        # Chiyoda, growing with the square root of the side beyond it: routes
+        # across the whole scaled grid give corridors of 100k+ nodes, which the
+        # legacy BFS takes minutes each on
+        hops = (side / args.base_side) ** 0.5
+        run(side, od_pairs(side, args.pairs, int(25 * hops), int(70 * hops)), optimal, G, not args.skip_legacy)
+
+
+if __name__ == '__main__':
+    main()
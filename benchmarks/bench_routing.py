@@ -0,0 +1,109 @@
+import argparse
+import json
+import resource
+import time
+import tracemalloc
+
+import numpy as np
+import networkx as nx
+
+from benchmarks.synthetic import features_city, use_offline_graph
+from utils.context import data
+from utils.metrics import metrics
+from utils.route_cache import RouteCache
+from utils.routing import generate_map
+
+# end-to-end latency of generate_map, split into the stages utils/metrics.py
+# times (geocode, snap, shortest, corridor search, alternatives, details, render),
+# plus the search counters and memory. origin/destination pairs are fixed by the
+# seed and typed as "lat,lon", so nothing is geocoded over the network, and a
+# zero-size route cache makes every run compute its route. run from the repo root:
+#   python -m benchmarks.bench_routing
+#   python -m benchmarks.bench_routing --pairs 50 --alternatives 3 --json results.json
+
+
+def od_queries(G, n_pairs, seed=0):
+    # pairs at least 20 hops apart, as "lat,lon" queries
+    rng = np.random.default_rng(seed)
+    nodes = list(G.nodes)
+    pairs = []
+    while len(pairs) < n_pairs:
+        source = nodes[rng.integers(len(nodes))]
+        hops = nx.single_source_shortest_path_length(G, source)
+        candidates = [node for node, count in hops.items() if count >= 20]
+        if not candidates:
+            continue
+        dest = candidates[rng.integers(len(candidates))]
+        pairs.append(tuple(f"{G.nodes[node]['y']},{G.nodes[node]['x']}" for node in (source, dest)))
+    return pairs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pairs', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--alternatives', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    G, _ = features_city()
+    use_offline_graph(G)
+    data.warm_up('network', 'node_grid', 'snapper')
+    pairs = od_queries(G, args.pairs, args.seed)
+    cache = RouteCache(maxsize=0)
+
+    # one untimed run, so imports and lazy datasets are not counted
+    generate_map(*pairs[0], cache=cache, alternatives=args.alternatives)
+    metrics.reset()
+
+    latencies, failures = [], 0
+    for _ in range(args.repeat):
+        for source, dest in pairs:
+            start = time.perf_counter()
+            try:
+                generate_map(source, dest, cache=cache, alternatives=args.alternatives)
+            except ValueError:
+                failures += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+    summary = metrics.summary()
+
+    # tracemalloc slows python down a lot, so peak memory gets a pass of its own
+    tracemalloc.start()
+    for source, dest in pairs:
+        try:
+            generate_map(source, dest, cache=cache, alternatives=args.alternatives)
+        except ValueError:
+            pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies = np.array(latencies) * 1e3
+    results = {
+        'routes': len(latencies),
+        'failures': failures,
+        'latency_ms': {f'p{q}': float(np.percentile(latencies, q)) for q in (50, 90, 99)},
+        'stages': summary['timers'],
+        'counters': summary['counters'],
+        'traced_peak_mb': peak / 2**20,
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10,
+    }
+
+    latency = results['latency_ms']
+    print(f"{results['routes']} routes ({failures} failed) over {len(G)} nodes, alternatives={args.alternatives}")
+    print(f"  latency  p50 {latency['p50']:8.1f} ms  p90 {latency['p90']:8.1f} ms  p99 {latency['p99']:8.1f} ms")
+    for name, stats in sorted(results['stages'].items(), key=lambda item: -item[1]['mean_ms']):
+        print(f"  {name:<16} mean {stats['mean_ms']:8.2f} ms  p50 {stats['p50_ms']:8.2f} ms"
+              f"  p95 {stats['p95_ms']:8.2f} ms  max {stats['max_ms']:8.2f} ms")
+    for name, value in sorted(results['counters'].items()):
+        print(f"  {name:<24} {value / max(results['routes'], 1):10.1f} per route")
+    print(f"  memory   traced peak {results['traced_peak_mb']:.1f} MB, max RSS {results['max_rss_mb']:.0f} MB")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
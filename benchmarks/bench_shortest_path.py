@@ -0,0 +1,90 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import networkx as nx
+
+from benchmarks.synthetic import grid_city, od_pairs
+from utils.landmarks import COST_METRICS, edge_costs, build_landmarks, save_landmarks, load_landmarks, alt_shortest_path
+
+# point-to-point shortest paths: ALT landmark queries against plain and
+# bidirectional NetworkX Dijkstra on the same costs, over synthetic grids from
+# Chiyoda-sized up to 100x its area. run from the repo root:
+#   python -m benchmarks.bench_shortest_path
+
+
+def synthetic_edge_weights(G, optimal_df):
+    optimal = optimal_df['optimal'].to_dict()
+    u, v, key, attrs = zip(*G.edges(keys=True, data=True))
+    return {
+        'u': np.array(u, dtype=np.int64),
+        'v': np.array(v, dtype=np.int64),
+        'key': np.array(key, dtype=np.int64),
+        'length': np.array([a['length'] for a in attrs]),
+        'optimal': np.array([optimal.get(a['osmid'], np.nan) for a in attrs]),
+    }
+
+
+def time_queries(fn, pairs):
+    timings, costs = [], []
+    for source, dest in pairs:
+        start = time.perf_counter()
+        costs.append(fn(source, dest))
+        timings.append(time.perf_counter() - start)
+    return np.array(timings), np.array(costs)
+
+
+def report(name, timings):
+    print(f'    {name:<24} median {np.median(timings) * 1e3:8.2f} ms  p95 {np.percentile(timings, 95) * 1e3:8.2f} ms')
+
+
+def run(side, n_pairs, n_landmarks, metric):
+    G, optimal_df = grid_city(side)
+    edge_weights = synthetic_edge_weights(G, optimal_df)
+    for (u, v, k), cost in zip(G.edges(keys=True), edge_costs(edge_weights, metric)):
+        G.edges[u, v, k]['cost'] = cost
+
+    start = time.perf_counter()
+    tables = build_landmarks(edge_weights, metric, n_landmarks)
+    built = time.perf_counter() - start
+
+    path = os.path.join(tempfile.mkdtemp(prefix='landmarks-'), metric)
+    save_landmarks(tables, path)
+    start = time.perf_counter()
+    tables = load_landmarks(path)
+    loaded = time.perf_counter() - start
+    table_mb = sum(np.asarray(tables[name]).nbytes for name in tables) / 2**20
+
+    print(f'grid {side}x{side} ({side * side} nodes), {metric} costs, {n_landmarks} landmarks: '
+          f'built in {built:.1f} s, {table_mb:.0f} MiB on disk, mmap load {loaded * 1e3:.1f} ms')
+
+    for hops in ((25, 70), (side // 2, side)):
+        pairs = od_pairs(side, n_pairs, *hops)
+        alt_timings, alt_costs = time_queries(lambda s, d: alt_shortest_path(tables, s, d)[1], pairs)
+        nx_timings, nx_costs = time_queries(lambda s, d: nx.dijkstra_path_length(G, s, d, weight='cost'), pairs)
+        bi_timings, _ = time_queries(lambda s, d: nx.bidirectional_dijkstra(G, s, d, weight='cost')[0], pairs)
+
+        mismatched = (~np.isclose(alt_costs, nx_costs)).sum()
+        print(f'  routes of {hops[0]}-{hops[1]} hops ({n_pairs} pairs, {mismatched} costs differ from networkx)')
+        report('ALT bidirectional', alt_timings)
+        report('networkx dijkstra', nx_timings)
+        report('networkx bidirectional', bi_timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pairs', type=int, default=20)
+    parser.add_argument('--base-side', type=int, default=55)
+    parser.add_argument('--scale', type=int, default=100)
+    parser.add_argument('--landmarks', type=int, default=8)
+    parser.add_argument('--metric', choices=COST_METRICS, default='weighted')
+    args = parser.parse_args()
+
+    for side in (args.base_side, int(args.base_side * args.scale ** 0.5)):
+        run(side, args.pairs, args.landmarks, args.metric)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import argparse
+import tempfile
+import time
+
+import numpy as np
+import osmnx as ox
+
+from benchmarks.synthetic import grid_city
+from utils.graph_store import BBOX, GRAPH_DIR, download_graph, load_snapshot, save_snapshot, snapshot_matches
+
+# startup cost of loading the bike graph from the local snapshot versus downloading
+# it from Overpass. run from the repo root: python -m benchmarks.bench_startup
+#
+# --synthetic times a snapshot of a generated grid instead, for machines without
+# a built snapshot or network access.
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return result, timings
+
+
+def report(name, timings):
+    print(f'  {name:<10} median {np.median(timings) * 1e3:8.1f} ms  min {np.min(timings) * 1e3:8.1f} ms  ({len(timings)} runs)')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--synthetic', type=int, default=0, help='grid side of a synthetic graph to snapshot')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        path = tempfile.mkdtemp()
+        G, _ = grid_city(args.synthetic)
+        nodes_gdf, roads_gdf = ox.graph_to_gdfs(G)
+        save_snapshot(nodes_gdf, roads_gdf, BBOX, path)
+    else:
+        path = GRAPH_DIR
+        if not snapshot_matches(BBOX, path):
+            print(f'No snapshot at {path}; build one with python -m utils.graph_store or pass --synthetic')
+            return
+
+    (G, nodes_gdf, roads_gdf), timings = timed(lambda: load_snapshot(path), args.repeat)
+    print(f'{len(nodes_gdf)} nodes, {len(roads_gdf)} edges')
+    report('snapshot', timings)
+
+    try:
+        _, timings = timed(lambda: download_graph(BBOX), 1)
+        report('download', timings)
+    except Exception as e:
+        print(f'  download   unavailable ({type(e).__name__})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+from collections.abc import Mapping
+
+import numpy as np
+
+# the corridor view of a dict adjacency the corridor search ran on before the CSR
+# graph in utils/csr.py, kept so the benchmarks can compare against it.
+
+
+class CorridorView(Mapping):
+    # read-only adjacency of the nodes in `nodes`, backed by the full adjacency:
+    # a neighbour list is filtered the first time the search asks for it, so only
+    # the lists of visited nodes are ever built
+    def __init__(self, adj, nodes):
+        self.adj = adj
+        self.nodes = nodes if isinstance(nodes, (set, frozenset)) else set(np.asarray(nodes).tolist())
+        self._filtered = {}
+
+    def __getitem__(self, node):
+        try:
+            return self._filtered[node]
+        except KeyError:
+            pass
+        if node not in self.nodes:
+            raise KeyError(node)
+        nbrs = self._filtered[node] = [(v, w) for v, w in self.adj[node] if v in self.nodes]
+        return nbrs
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, node):
+        return node in self.nodes
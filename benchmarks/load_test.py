@@ -0,0 +1,177 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+from urllib.parse import urlsplit, urlencode
+
+import numpy as np
+
+from benchmarks.synthetic import features_city, use_offline_graph
+
+# load test for utils/service.py: a number of keep-alive connections send route
+# queries back to back for a fixed number of requests, and the run reports
+# requests/sec, latency percentiles, status codes and how many queries the
+# service coalesced. queries are drawn from a pool of --distinct origin/destination
+# pairs, so a small pool means many identical queries in flight at once.
+#
+# without --url it starts the service itself on the offline features graph, so
+# nothing is downloaded. run from the repo root:
+#   python -m benchmarks.load_test
+#   python -m benchmarks.load_test --workers 4 --connections 32 --requests 2000 --distinct 50
+#   python -m benchmarks.load_test --url http://127.0.0.1:8080 --endpoint batch
+
+
+class Connection:
+    # one keep-alive HTTP/1.1 connection, requests sent one at a time
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, method, target, payload=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = b'' if payload is None else json.dumps(payload).encode()
+        self.writer.write(
+            f'{method} {target} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\n\r\n'.encode('latin-1') + body
+        )
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while (line := await self.reader.readline()) not in (b'\r\n', b''):
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        data = await self.reader.readexactly(int(headers['content-length']))
+        if headers.get('connection') == 'close':
+            self.close()
+        return status, data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def od_queries(G, n_pairs, seed=0):
+    # "lat,lon" pairs between random graph nodes
+    rng = np.random.default_rng(seed)
+    nodes = list(G.nodes)
+    pairs = []
+    for _ in range(n_pairs):
+        source, dest = (G.nodes[nodes[rng.integers(len(nodes))]] for _ in range(2))
+        pairs.append((f"{source['y']},{source['x']}", f"{dest['y']},{dest['x']}"))
+    return pairs
+
+
+def make_request(endpoint, pair, batch_size):
+    source, dest = pair
+    if endpoint == 'route':
+        return 'GET', '/route?' + urlencode({'source': source, 'destination': dest}), None
+    if endpoint == 'images':
+        return 'GET', '/images?' + urlencode({'source': source, 'destination': dest, 'limit': 10}), None
+    return 'POST', '/routes/batch', {'queries': [{'source': source, 'destination': dest}] * batch_size}
+
+
+async def run_load(host, port, pairs, endpoint, connections, n_requests, batch_size, seed):
+    rng = np.random.default_rng(seed)
+    plan = [make_request(endpoint, pairs[i], batch_size) for i in rng.integers(len(pairs), size=n_requests)]
+    latencies, statuses = [], Counter()
+
+    async def client():
+        connection = Connection(host, port)
+        try:
+            while plan:
+                method, target, payload = plan.pop()
+                start = time.perf_counter()
+                try:
+                    status, _ = await connection.request(method, target, payload)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    connection.close()
+                    status = 'connection error'
+                latencies.append(time.perf_counter() - start)
+                statuses[status] += 1
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(connections)))
+    return time.perf_counter() - start, np.array(latencies) * 1e3, statuses
+
+
+async def health(host, port):
+    connection = Connection(host, port)
+    try:
+        _, data = await connection.request('GET', '/health')
+        return json.loads(data)
+    finally:
+        connection.close()
+
+
+async def wait_until_up(host, port, process, timeout=600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'service exited with {process.returncode}')
+        try:
+            return await health(host, port)
+        except OSError:
+            await asyncio.sleep(0.5)
+    raise TimeoutError('service did not start')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', help='a running service; by default one is started on the offline graph')
+    parser.add_argument('--port', type=int, default=8787, help='port of the started service')
+    parser.add_argument('--workers', type=int, default=2, help='worker processes of the started service')
+    parser.add_argument('--endpoint', choices=('route', 'batch', 'images'), default='route')
+    parser.add_argument('--connections', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--distinct', type=int, default=40, help='distinct origin/destination pairs')
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    G, _ = features_city()
+    pairs = od_queries(G, args.distinct, args.seed)
+
+    process = None
+    if args.url is None:
+        host, port = '127.0.0.1', args.port
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'utils.service', '--port', str(port), '--workers', str(args.workers),
+             '--graph-path', use_offline_graph(G)],
+            stdout=subprocess.DEVNULL,
+        )
+    else:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+
+    try:
+        asyncio.run(wait_until_up(host, port, process) if process else health(host, port))
+        coalesced_before = asyncio.run(health(host, port))['metrics']['counters'].get('service.coalesced', 0)
+        seconds, latencies, statuses = asyncio.run(run_load(
+            host, port, pairs, args.endpoint, args.connections, args.requests, args.batch_size, args.seed,
+        ))
+        coalesced = asyncio.run(health(host, port))['metrics']['counters'].get('service.coalesced', 0) - coalesced_before
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    print(f'{args.requests} {args.endpoint} requests over {args.connections} connections, '
+          f'{args.distinct} distinct pairs{f", {args.workers} workers" if process else ""}')
+    print(f'  throughput {args.requests / seconds:8.1f} requests/s  ({seconds:.1f} s)')
+    print(f'  latency    p50 {np.percentile(latencies, 50):8.1f} ms  p90 {np.percentile(latencies, 90):8.1f} ms'
+          f'  p99 {np.percentile(latencies, 99):8.1f} ms  max {latencies.max():8.1f} ms')
+    print(f'  statuses   {dict(statuses)}')
+    print(f'  coalesced  {coalesced} queries shared a computation already in flight')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import tempfile
+import numpy as np
+import pandas as pd
+import networkx as nx
+import osmnx as ox
+
+from utils.context import data
+from utils.graph_store import BBOX, save_snapshot
+
+# synthetic street grids with osmnx-style attributes, so benchmarks run without
+# network access. side=55 is roughly the node count of the unsimplified Chiyoda
+# bbox in utils/routing.py; side=550 covers 100x its area.
+
+SPACING_DEG = 2e-4
+
+
+def grid_city(side=55, missing_fraction=0.3, seed=0):
+    rng = np.random.default_rng(seed)
+    west, south = 139.758834, 35.691657
+
+    G = nx.MultiDiGraph(crs='EPSG:4326')
+    jitter = rng.normal(scale=SPACING_DEG * 0.1, size=(side * side, 2))
+    for i in range(side):
+        for j in range(side):
+            node = i * side + j
+            G.add_node(node, x=west + j * SPACING_DEG + jitter[node, 0], y=south + i * SPACING_DEG + jitter[node, 1])
+
+    # one osmid per street segment of 10 blocks, like OSM ways along a road
+    def way_id(kind, line, offset):
+        return 1_000_000 + (kind * side + line) * side + offset // 10
+
+    for i in range(side):
+        for j in range(side):
+            node = i * side + j
+            if j + 1 < side:
+                _add_both_ways(G, node, node + 1, way_id(0, i, j))
+            if i + 1 < side:
+                _add_both_ways(G, node, node + side, way_id(1, j, i))
+
+    osmids = sorted({data['osmid'] for _, _, data in G.edges(data=True)})
+    optimal = rng.uniform(0.1, 0.9, size=len(osmids))
+    known = rng.uniform(size=len(osmids)) >= missing_fraction
+    optimal_df = pd.DataFrame({'optimal': optimal[known]}, index=pd.Index(np.array(osmids)[known], name='osmid'))
+
+    return G, optimal_df
+
+
+def _add_both_ways(G, u, v, osmid):
+    length = _haversine(G.nodes[u]['x'], G.nodes[u]['y'], G.nodes[v]['x'], G.nodes[v]['y'])
+    G.add_edge(u, v, osmid=osmid, length=length)
+    G.add_edge(v, u, osmid=osmid, length=length)
+
+
+def _haversine(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return float(2 * 6371008.8 * np.arcsin(np.sqrt(a)))
+
+
+def od_pairs(side, n_pairs, min_hops, max_hops, seed=0):
+    rng = np.random.default_rng(seed)
+    pairs = []
+    while len(pairs) < n_pairs:
+        i, j = rng.integers(0, side, size=2)
+        di, dj = rng.integers(-max_hops, max_hops + 1, size=2)
+        if not min_hops <= abs(di) + abs(dj) <= max_hops:
+            continue
+        if not (0 <= i + di < side and 0 <= j + dj < side):
+            continue
+        pairs.append((int(i * side + j), int((i + di) * side + j + dj)))
+    return pairs
+
+
+def features_city(features_path='utils/datasets/optimal_features.parquet'):
+    # a bike graph rebuilt from the way geometries in optimal_features, so osmids
+    # line up with the real features and images. vertices shared by ways (to 1e-6
+    # degrees) become one node.
+    import shapely
+
+    features = pd.read_parquet(features_path)
+    G = nx.MultiDiGraph(crs='EPSG:4326')
+    node_ids = {}
+
+    def node_for(x, y):
+        key = (round(x, 6), round(y, 6))
+        if key not in node_ids:
+            node_ids[key] = len(node_ids) + 1
+            G.add_node(node_ids[key], x=x, y=y)
+        return node_ids[key]
+
+    for osmid, wkb in zip(features.index, features['geometry']):
+        geom = shapely.from_wkb(wkb)
+        for line in getattr(geom, 'geoms', [geom]):
+            coords = list(line.coords)
+            for (x1, y1), (x2, y2) in zip(coords[:-1], coords[1:]):
+                u, v = node_for(x1, y1), node_for(x2, y2)
+                if u != v and not G.has_edge(u, v):
+                    _add_both_ways(G, u, v, int(osmid))
+
+    return G, features
+
+
+def use_offline_graph(G, features=None):
+    # point the shared data context at a snapshot of G in a temp dir
+    nodes_gdf, roads_gdf = ox.graph_to_gdfs(G)
+    path = tempfile.mkdtemp(prefix='graph-')
+    save_snapshot(nodes_gdf, roads_gdf, BBOX, path)
+
+    data.reset()
+    data.graph_path = path
+    if features is not None:
+        data.provide('features', features)
+    return path
@@ -0,0 +1,120 @@
+import numpy as np
+import networkx as nx
+import pytest
+
+from utils.metrics import metrics
+from utils.search import max_avg_path
+
+
+def grid_adjacency(side, rng, missing=0.2):
+    G = nx.grid_2d_graph(side, side).to_directed()
+    return _adjacency(G, rng, missing)
+
+
+def random_adjacency(n_nodes, p, rng, missing=0.1):
+    G = nx.gnp_random_graph(n_nodes, p, seed=int(rng.integers(2**31)), directed=True)
+    return _adjacency(G, rng, missing)
+
+
+def _adjacency(G, rng, missing):
+    adj = {node: [] for node in G}
+    for u, v in G.edges():
+        if rng.random() >= missing:
+            adj[u].append((v, float(rng.random())))
+    return adj
+
+
+def digraph(adj):
+    G = nx.DiGraph()
+    G.add_nodes_from(adj)
+    G.add_weighted_edges_from((u, v, w) for u, nbrs in adj.items() for v, w in nbrs)
+    return G
+
+
+def brute_force(adj, start, end, max_depth):
+    # the best mean over every simple path within the detour budget
+    G = digraph(adj)
+    try:
+        cutoff = nx.shortest_path_length(G, start, end) + max_depth
+    except nx.NetworkXNoPath:
+        return -np.inf
+    return max(
+        np.mean([G[a][b]['weight'] for a, b in zip(path, path[1:])])
+        for path in nx.all_simple_paths(G, start, end, cutoff=cutoff)
+    )
+
+
+def check(adj, start, end, max_depth, max_labels=None):
+    # exact without a label cap; with one, a valid path no better than the best
+    path, score = max_avg_path(adj, start, end, max_depth=max_depth, max_labels=max_labels)
+    expected = brute_force(adj, start, end, max_depth)
+    if expected == -np.inf:
+        assert path is None
+        return
+
+    if max_labels is None:
+        assert score == pytest.approx(expected)
+    else:
+        assert score <= expected + 1e-12
+    assert path[0] == start and path[-1] == end
+    assert len(set(path)) == len(path)
+    weights = [dict(adj[a])[b] for a, b in zip(path, path[1:])]
+    assert np.mean(weights) == pytest.approx(score)
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_matches_brute_force_on_grids(seed):
+    rng = np.random.default_rng(seed)
+    adj = grid_adjacency(5, rng)
+    nodes = list(adj)
+    for _ in range(5):
+        start, end = (nodes[i] for i in rng.choice(len(nodes), 2, replace=False))
+        check(adj, start, end, max_depth=4)
+
+
+@pytest.mark.parametrize('seed', range(60))
+def test_matches_brute_force_on_random_digraphs(seed):
+    rng = np.random.default_rng(seed)
+    adj = random_adjacency(10, 0.3, rng)
+    start, end = rng.choice(10, 2, replace=False).tolist()
+    check(adj, start, end, max_depth=3)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_capped_labels_give_valid_paths(seed):
+    rng = np.random.default_rng(seed)
+    adj = grid_adjacency(5, rng)
+    nodes = list(adj)
+    for _ in range(5):
+        start, end = (nodes[i] for i in rng.choice(len(nodes), 2, replace=False))
+        check(adj, start, end, max_depth=4, max_labels=1)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_capped_labels_give_valid_paths_on_random_digraphs(seed):
+    # unlike a grid, a node here can get labels in consecutive levels, so a label
+    # can be replaced before it is expanded
+    rng = np.random.default_rng(seed)
+    adj = random_adjacency(10, 0.3, rng)
+    start, end = rng.choice(10, 2, replace=False).tolist()
+    check(adj, start, end, max_depth=3, max_labels=1)
+
+
+def test_start_is_end():
+    adj = {0: [(1, 0.5)], 1: []}
+    assert max_avg_path(adj, 0, 0) == ([0], 0.0)
+
+
+def test_unreachable():
+    adj = {0: [], 1: [(0, 0.5)]}
+    path, score = max_avg_path(adj, 0, 1)
+    assert path is None and score == -np.inf
+
+
+def test_counts_expanded_and_pushed_labels():
+    adj = {0: [(1, 0.5), (2, 0.1)], 1: [(3, 0.5)], 2: [(3, 0.9)], 3: []}
+    metrics.reset()
+    max_avg_path(adj, 0, 3, max_labels=None)
+    counters = metrics.summary()['counters']
+    assert counters['search.expanded'] >= 1
+    assert counters['search.pushes'] >= 1
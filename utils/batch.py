@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import argparse
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
+
+from utils.context import data
+from utils.snapping import MAX_SNAP_M, snap_to_nodes
+from utils.routing import compute_route
+
+# routes many origin-destination pairs without drawing maps. the graph is loaded
+# once in the parent and shared with fork()ed workers copy-on-write; where fork is
+# not available each spawned worker loads the snapshot once in its initializer.
+#
+#   python -m utils.batch pairs.csv --output routes.parquet --workers 4
+#
+# pairs.csv has source,dest node ids or source_lat,source_lon,dest_lat,dest_lon.
+
+# what compute_route needs, loaded before the workers fork so they share it
+WARM_DATASETS = ('network', 'node_grid')
+
+RESULT_COLUMNS = (
+    'source', 'dest', 'ok', 'error',
+    'shortest_length_m', 'shortest_optimality', 'practical_length_m', 'practical_optimality',
+    'path_shortest', 'path_practical',
+)
+
+
+def _route_pair(args):
+    source, dest, corridor_padding_percent, max_depth = args
+    if source is None or dest is None:
+        end = 'source' if source is None else 'dest'
+        return {'source': source, 'dest': dest, 'ok': False,
+                'error': f'ValueError: {end} is more than {MAX_SNAP_M} m from the nearest street'}
+    try:
+        route = compute_route(source, dest, corridor_padding_percent, max_depth)
+    except Exception as e:
+        return {'source': source, 'dest': dest, 'ok': False, 'error': f'{type(e).__name__}: {e}'}
+
+    return {
+        'source': source,
+        'dest': dest,
+        'ok': True,
+        'error': None,
+        'shortest_length_m': route['path_shortest_details']['length_m'],
+        'shortest_optimality': route['path_shortest_details']['optimality'],
+        'practical_length_m': route['path_practical_details']['length_m'],
+        'practical_optimality': route['path_practical_details']['optimality'],
+        'path_shortest': [int(node) for node in route['path_shortest']],
+        'path_practical': [int(node) for node in route['path_practical']],
+    }
+
+
+def _init_worker():
+    data.warm_up(*WARM_DATASETS)
+
+
+def snap_pairs(pairs):
+    # pairs of node ids pass through; pairs of (lat, lon) points are snapped in bulk
+    # (see utils/snapping.py), and a point too far from every street becomes None
+    pairs = list(pairs)
+    if not pairs or np.ndim(pairs[0][0]) == 0:
+        return [(int(source), int(dest)) for source, dest in pairs]
+
+    points = np.asarray(pairs, dtype=np.float64)
+    ends = []
+    for i in (0, 1):
+        node_ids, distances = snap_to_nodes(data.snapper, points[:, i, 0], points[:, i, 1])
+        ends.append([node if distance <= MAX_SNAP_M else None for node, distance in zip(node_ids.tolist(), distances.tolist())])
+    return list(zip(*ends))
+
+
+class _Writer:
+    def __init__(self, output, batch_size=1024):
+        self.output = output
+        self.batch_size = batch_size
+        self.batch = []
+        self._jsonl = None
+        self._parquet = None
+
+        if output.endswith('.jsonl'):
+            self._jsonl = open(output, 'w')
+        elif not output.endswith('.parquet'):
+            raise ValueError(f'Unsupported output format: {output}. Expected .jsonl or .parquet')
+
+    def write(self, result):
+        if self._jsonl is not None:
+            self._jsonl.write(json.dumps(result) + '\n')
+            return
+        self.batch.append(result)
+        if len(self.batch) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not self.batch:
+            return
+        rows = [{column: row.get(column) for column in RESULT_COLUMNS} for row in self.batch]
+        table = pa.Table.from_pylist(rows, schema=_schema())
+        if self._parquet is None:
+            self._parquet = pq.ParquetWriter(self.output, table.schema)
+        self._parquet.write_table(table)
+        self.batch = []
+
+    def close(self):
+        if self._jsonl is not None:
+            self._jsonl.close()
+            return
+        self._flush()
+        if self._parquet is not None:
+            self._parquet.close()
+
+
+def _schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ('source', pa.int64()), ('dest', pa.int64()), ('ok', pa.bool_()), ('error', pa.string()),
+        ('shortest_length_m', pa.float64()), ('shortest_optimality', pa.float64()),
+        ('practical_length_m', pa.float64()), ('practical_optimality', pa.float64()),
+        ('path_shortest', pa.list_(pa.int64())), ('path_practical', pa.list_(pa.int64())),
+    ])
+
+
+def route_many(pairs, output=None, workers=None, chunksize=16, corridor_padding_percent=0.20, max_depth=50):
+    # returns (results, stats); results is None when they are streamed to output
+    workers = workers or os.cpu_count()
+    data.warm_up(*WARM_DATASETS)
+    pairs = snap_pairs(pairs)
+    tasks = [(source, dest, corridor_padding_percent, max_depth) for source, dest in pairs]
+
+    writer = _Writer(output) if output else None
+    results = None if writer else []
+    failed = 0
+
+    pool = None
+    start = time.perf_counter()
+    try:
+        if workers == 1:
+            outcomes = map(_route_pair, tasks)
+        else:
+            if 'fork' in mp.get_all_start_methods():
+                pool = mp.get_context('fork').Pool(workers)
+            else:
+                pool = mp.get_context('spawn').Pool(workers, initializer=_init_worker)
+            outcomes = pool.imap_unordered(_route_pair, tasks, chunksize=chunksize)
+
+        for result in outcomes:
+            failed += not result['ok']
+            if writer:
+                writer.write(result)
+            else:
+                results.append(result)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if writer:
+            writer.close()
+    seconds = time.perf_counter() - start
+
+    routes_per_sec = len(tasks) / seconds if seconds else float('inf')
+    stats = {
+        'routes': len(tasks),
+        'failed': failed,
+        'workers': workers,
+        'seconds': seconds,
+        'routes_per_sec': routes_per_sec,
+        'routes_per_sec_per_core': routes_per_sec / workers,
+    }
+    return results, stats
+
+
+def read_pairs(path):
+    pairs_df = pd.read_csv(path)
+    if {'source', 'dest'} <= set(pairs_df.columns):
+        return list(zip(pairs_df['source'], pairs_df['dest']))
+    return [
+        ((row.source_lat, row.source_lon), (row.dest_lat, row.dest_lon))
+        for row in pairs_df.itertuples(index=False)
+    ]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Route origin-destination pairs in bulk.')
+    parser.add_argument('pairs', help='csv with source,dest or source_lat,source_lon,dest_lat,dest_lon')
+    parser.add_argument('--output', required=True, help='.parquet or .jsonl')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunksize', type=int, default=16)
+    args = parser.parse_args()
+
+    _, stats = route_many(read_pairs(args.pairs), output=args.output, workers=args.workers, chunksize=args.chunksize)
+    print(f"{stats['routes']} routes ({stats['failed']} failed) in {stats['seconds']:.1f} s with {stats['workers']} workers: "
+          f"{stats['routes_per_sec']:.1f} routes/s, {stats['routes_per_sec_per_core']:.1f} routes/s per core")
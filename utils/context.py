@@ -0,0 +1,228 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+
+from utils.graph_store import BBOX, GRAPH_DIR, load_graph, snapshot_created
+from utils.edge_weights import load_or_build_edge_weights, edge_optimal_lookup
+from utils.edge_index import build_edge_index
+from utils.geocoding import build_gazetteer
+from utils.snapping import build_snapper
+from utils.image_index import build_image_index
+from utils.pareto import build_pareto_adjacency
+from utils.corridor import build_node_grid_from_gdf
+from utils.csr import build_csr_from_gdf, csr_edge_values
+from utils.time_costs import IMAGE_MATCHES_PATH, has_capture_times, load_or_build_time_costs
+from utils.landmarks import COST_METRICS, load_or_build_landmarks
+
+# datasets used by utils.routing, each loaded on first access so importing the
+# module (or using only the image helpers) does not read the graph. loads are
+# guarded per dataset, so concurrent Streamlit sessions share one load.
+
+DATASETS = (
+    'images_matches', 'features', 'image_to_url', 'network', 'edge_optimals', 'pareto_adjacency', 'gazetteer',
+    'snapper', 'image_index', 'node_grid', 'landmarks', 'time_costs',
+)
+
+
+def network_version(edge_weights, created=None):
+    # identifies the graph and the optimality joined onto it, for results cached
+    # across rebuilds (see utils/route_cache.py); created is the snapshot's
+    u, v = np.asarray(edge_weights['u']), np.asarray(edge_weights['v'])
+    return [created, len(u), int(u.sum() % 2**31), int(v.sum() % 2**31), *np.asarray(edge_weights['fingerprint']).tolist()]
+
+
+def build_network(G, nodes_gdf, roads_gdf, features, edge_weights_path=None, created=None):
+    # per-edge optimality and length, joined once and cached on disk when a path is given
+    edge_weights = load_or_build_edge_weights(roads_gdf, features, edge_weights_path)
+    roads_gdf['optimal'] = edge_weights['optimal']
+
+    return {
+        'G': G,
+        'nodes_gdf': nodes_gdf,
+        'roads_gdf': roads_gdf,
+        'edge_weights': edge_weights,
+        'edge_index': build_edge_index(edge_weights),
+        # the whole graph as arrays for the searches; corridors are views of it
+        'csr': build_csr_from_gdf(nodes_gdf, edge_weights),
+        'version': network_version(edge_weights, created),
+    }
+
+
+class DataContext:
+    # graph_path=None is for contexts whose network is provided, e.g. stitched
+    # from tiles by utils/tiles.py; nothing derived from it is written to disk
+    def __init__(self, bbox=BBOX, graph_path=GRAPH_DIR):
+        self.bbox = bbox
+        self.graph_path = graph_path
+        self._values = {}
+        self._locks = {name: threading.Lock() for name in DATASETS}
+
+    def _get(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            pass
+
+        with self._locks[name]:
+            if name not in self._values:
+                self._values[name] = getattr(self, f'_load_{name}')()
+            return self._values[name]
+
+    def warm_up(self, *names):
+        for name in names or DATASETS:
+            self._get(name)
+
+    def reset(self, *names):
+        for name in names or DATASETS:
+            with self._locks[name]:
+                self._values.pop(name, None)
+
+    def is_loaded(self, name):
+        return name in self._values
+
+    def provide(self, name, value):
+        # use an already-built dataset instead of loading it, e.g. in benchmarks
+        with self._locks[name]:
+            self._values[name] = value
+
+    # loaders
+    def _load_images_matches(self):
+        # image_id to osmid
+        images_matches = gpd.read_parquet(IMAGE_MATCHES_PATH)
+        images_matches = images_matches[images_matches['pedestrians'] + images_matches['vehicles'] > 0]
+        images_matches.set_index('image_id', inplace=True)
+        return images_matches.to_crs("EPSG:4326")
+
+    def _load_features(self):
+        return pd.read_parquet('utils/datasets/optimal_features.parquet')
+
+    def _load_image_to_url(self):
+        return pd.read_parquet('utils/datasets/image_to_url.parquet')
+
+    def _load_network(self):
+        # nodes and edges (roads), from the local snapshot when there is one
+        G, nodes_gdf, roads_gdf = load_graph(self.bbox, self.graph_path)
+        return build_network(G, nodes_gdf, roads_gdf, self.features, os.path.join(self.graph_path, 'edge_weights'),
+                             snapshot_created(self.graph_path))
+
+    def _load_edge_optimals(self):
+        # (u, v) -> optimality, only for graphs searched without the CSR arrays
+        return edge_optimal_lookup(self.edge_weights)
+
+    def _load_pareto_adjacency(self):
+        # only built when a route first asks for alternatives
+        return build_pareto_adjacency(self.edge_weights)
+
+    def _load_gazetteer(self):
+        return build_gazetteer(self.nodes_gdf, self.roads_gdf)
+
+    def _load_snapper(self):
+        return build_snapper(self.nodes_gdf, self.roads_gdf)
+
+    def _load_node_grid(self):
+        return build_node_grid_from_gdf(self.nodes_gdf)
+
+    def _load_landmarks(self):
+        # only built (and then cached on disk) when a landmark query first needs them
+        path = None if self.graph_path is None else os.path.join(self.graph_path, 'landmarks')
+        return {metric: load_or_build_landmarks(self.edge_weights, metric, path) for metric in COST_METRICS}
+
+    def _load_time_costs(self):
+        # (CSR entries x departure buckets); built from every matched image, not
+        # only the ones with detections that images_matches keeps. None when no
+        # image has a capture time, since every bucket would be the all-day optimality
+        images = pd.read_parquet(IMAGE_MATCHES_PATH)
+        if not has_capture_times(images):
+            return None
+        path = None if self.graph_path is None else os.path.join(self.graph_path, 'time_costs')
+        table = load_or_build_time_costs(self.roads_gdf, self.features, images, path)
+        return csr_edge_values(self.csr, self.edge_weights, table)
+
+    def _load_image_index(self):
+        return build_image_index(self.images_matches, self.features, self.nodes_gdf, self.roads_gdf, self.edge_weights)
+
+    # datasets
+    @property
+    def images_matches(self):
+        return self._get('images_matches')
+
+    @property
+    def features(self):
+        return self._get('features')
+
+    @property
+    def image_to_url(self):
+        return self._get('image_to_url')
+
+    @property
+    def G(self):
+        return self._get('network')['G']
+
+    @property
+    def nodes_gdf(self):
+        return self._get('network')['nodes_gdf']
+
+    @property
+    def roads_gdf(self):
+        return self._get('network')['roads_gdf']
+
+    @property
+    def edge_weights(self):
+        return self._get('network')['edge_weights']
+
+    @property
+    def edge_optimals(self):
+        return self._get('edge_optimals')
+
+    @property
+    def edge_index(self):
+        return self._get('network')['edge_index']
+
+    @property
+    def csr(self):
+        return self._get('network')['csr']
+
+    @property
+    def pareto_adjacency(self):
+        return self._get('pareto_adjacency')
+
+    @property
+    def data_version(self):
+        return self._get('network')['version']
+
+    @property
+    def gazetteer(self):
+        return self._get('gazetteer')
+
+    @property
+    def snapper(self):
+        return self._get('snapper')
+
+    @property
+    def image_index(self):
+        return self._get('image_index')
+
+    @property
+    def node_grid(self):
+        return self._get('node_grid')
+
+    @property
+    def landmarks(self):
+        return self._get('landmarks')
+
+    @property
+    def time_costs(self):
+        return self._get('time_costs')
+
+
+data = DataContext()
+
+
+def warm_up(*names):
+    data.warm_up(*names)
+
+
+def reset(*names):
+    data.reset(*names)
@@ -0,0 +1,55 @@
+import numpy as np
+
+# corridor extraction for the optimal-path search. nodes are bucketed into a
+# uniform lon/lat grid once, sorted by cell in row-major order, so the nodes of a
+# bbox are one contiguous slice per grid row followed by an exact filter. the
+# search then runs on those nodes' edges cut out of the CSR graph (see
+# utils/csr.py), instead of on a copied subgraph.
+
+
+def build_node_grid(node_ids, xs, ys, nodes_per_cell=4):
+    node_ids = np.asarray(node_ids, dtype=np.int64)
+    xs, ys = np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+
+    min_x, min_y = xs.min(), ys.min()
+    area = max((xs.max() - min_x) * (ys.max() - min_y), 1e-12)
+    cell = float(np.sqrt(area * nodes_per_cell / len(node_ids)))
+    n_cols = int((xs.max() - min_x) // cell) + 1
+    n_rows = int((ys.max() - min_y) // cell) + 1
+
+    cells = ((ys - min_y) // cell).astype(np.int64) * n_cols + ((xs - min_x) // cell).astype(np.int64)
+    order = np.argsort(cells, kind='stable')
+
+    return {
+        'origin': (min_x, min_y),
+        'cell': cell,
+        'shape': (n_rows, n_cols),
+        'node_ids': node_ids[order],
+        'xs': xs[order],
+        'ys': ys[order],
+        'cell_starts': np.searchsorted(cells[order], np.arange(n_rows * n_cols + 1)),
+    }
+
+
+def build_node_grid_from_gdf(nodes_gdf):
+    return build_node_grid(nodes_gdf.index.to_numpy(), nodes_gdf['x'].to_numpy(), nodes_gdf['y'].to_numpy())
+
+
+def nodes_in_bbox(grid, min_lon, min_lat, max_lon, max_lat):
+    (origin_x, origin_y), cell, (n_rows, n_cols) = grid['origin'], grid['cell'], grid['shape']
+
+    col0 = max(int((min_lon - origin_x) // cell), 0)
+    col1 = min(int((max_lon - origin_x) // cell), n_cols - 1)
+    row0 = max(int((min_lat - origin_y) // cell), 0)
+    row1 = min(int((max_lat - origin_y) // cell), n_rows - 1)
+    if col0 > col1 or row0 > row1:
+        return grid['node_ids'][:0]
+
+    starts = grid['cell_starts']
+    candidates = np.concatenate([
+        np.arange(starts[row * n_cols + col0], starts[row * n_cols + col1 + 1])
+        for row in range(row0, row1 + 1)
+    ])
+    xs, ys = grid['xs'][candidates], grid['ys'][candidates]
+    inside = (min_lon <= xs) & (xs <= max_lon) & (min_lat <= ys) & (ys <= max_lat)
+    return grid['node_ids'][candidates[inside]]
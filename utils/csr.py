@@ -0,0 +1,155 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import shortest_path
+
+from utils.edge_index import node_positions
+
+# the routing graph as compressed sparse rows: node ids sorted into dense
+# positions, and per position a slice of indptr/indices with its out-neighbours
+# and their edge weights. parallel edges are merged into one entry per directed
+# node pair, keeping the shortest length and the best optimality (as
+# utils/edge_weights.edge_optimal_lookup does), so an edge costs a few array slots
+# instead of NetworkX's nested attribute dicts.
+#
+# searches run on positions and map back to node ids at the end: the fewest-hop
+# shortest path is a breadth-first search on the arrays, and the corridor search
+# runs max_avg_path on the adjacency of a CSRCorridor, cut out of the arrays for
+# the corridor's nodes.
+
+
+def build_csr(edge_weights, node_ids, xs, ys):
+    order = np.argsort(np.asarray(node_ids, dtype=np.int64), kind='stable')
+    nodes = np.asarray(node_ids, dtype=np.int64)[order]
+    n_nodes = len(nodes)
+
+    u_pos = np.searchsorted(nodes, np.asarray(edge_weights['u'], dtype=np.int64))
+    v_pos = np.searchsorted(nodes, np.asarray(edge_weights['v'], dtype=np.int64))
+    length = np.asarray(edge_weights['length'], dtype=np.float64)
+    optimal = np.asarray(edge_weights['optimal'], dtype=np.float64)
+
+    edge_order = np.lexsort((v_pos, u_pos))
+    u_pos, v_pos = u_pos[edge_order], v_pos[edge_order]
+    starts = np.flatnonzero(np.r_[True, (u_pos[1:] != u_pos[:-1]) | (v_pos[1:] != v_pos[:-1])])
+    if len(edge_order):
+        # fmax skips nan, so a pair is nan only when none of its edges is rated
+        length = np.minimum.reduceat(length[edge_order], starts)
+        optimal = np.fmax.reduceat(optimal[edge_order], starts)
+    u_pos, v_pos = u_pos[starts], v_pos[starts]
+
+    return {
+        'nodes': nodes,
+        'x': np.asarray(xs, dtype=np.float64)[order],
+        'y': np.asarray(ys, dtype=np.float64)[order],
+        'indptr': np.r_[0, np.cumsum(np.bincount(u_pos, minlength=n_nodes))],
+        'indices': v_pos.astype(np.int32),
+        'length': length,
+        'optimal': optimal,
+    }
+
+
+def build_csr_from_gdf(nodes_gdf, edge_weights):
+    return build_csr(edge_weights, nodes_gdf.index.to_numpy(), nodes_gdf['x'].to_numpy(), nodes_gdf['y'].to_numpy())
+
+
+def csr_edge_values(csr, edge_weights, values):
+    # per-row values aligned with the edge arrays (a weight column or a table of
+    # them) as per-entry values, keeping the best of parallel edges like build_csr
+    nodes, indptr, indices = csr['nodes'], csr['indptr'], csr['indices']
+    n_nodes = len(nodes)
+    entry_keys = np.repeat(np.arange(n_nodes), np.diff(indptr)) * n_nodes + indices
+    row_keys = (np.searchsorted(nodes, np.asarray(edge_weights['u'], dtype=np.int64)) * n_nodes
+                + np.searchsorted(nodes, np.asarray(edge_weights['v'], dtype=np.int64)))
+
+    values = np.asarray(values)
+    entry_values = np.full((len(indices),) + values.shape[1:], np.nan, dtype=values.dtype)
+    np.fmax.at(entry_values, np.searchsorted(entry_keys, row_keys), values)
+    return entry_values
+
+
+def csr_nbytes(csr):
+    return sum(value.nbytes for name, value in csr.items() if not name.startswith('_'))
+
+
+def position(csr, node):
+    pos = int(node_positions(csr, [node])[0])
+    if pos < 0:
+        raise KeyError(f'{node} is not in the graph')
+    return pos
+
+
+def _out_edges(indptr, positions):
+    # entry indices of every out-edge of positions, grouped by position
+    starts, counts = indptr[positions], indptr[positions + 1] - indptr[positions]
+    return np.repeat(starts - np.r_[0, np.cumsum(counts)[:-1]], counts) + np.arange(counts.sum()), counts
+
+
+def shortest_hop_path(csr, source, target):
+    # a fewest-edge path of node ids (what nx.shortest_path returns without a
+    # weight), or None when target cannot be reached. the breadth-first search
+    # expands a whole level per numpy pass and stops at the level that reaches
+    # target, so it only visits nodes closer to source than target is
+    s, t = position(csr, source), position(csr, target)
+    if s == t:
+        return [source]
+
+    indptr, indices = csr['indptr'], csr['indices']
+    predecessors = np.full(len(csr['nodes']), -1, dtype=np.int64)
+    predecessors[s] = s
+    frontier = np.array([s])
+    while len(frontier) and predecessors[t] < 0:
+        edges, counts = _out_edges(indptr, frontier)
+        reached = indices[edges]
+        new = predecessors[reached] < 0
+        reached, sources = reached[new], np.repeat(frontier, counts)[new]
+        predecessors[reached] = sources
+        # a node reached from several sources keeps the last one, and once
+        frontier = reached[predecessors[reached] == sources]
+    if predecessors[t] < 0:
+        return None
+
+    path = [t]
+    while path[-1] != s:
+        path.append(predecessors[path[-1]])
+    return csr['nodes'][path[::-1]].tolist()
+
+
+class CSRCorridor:
+    # the search adjacency (position -> [(position, optimality)]) of the nodes at
+    # `positions`, without edges that leave them or have no optimality. the edges
+    # are cut out of the arrays in one vectorized pass, so only the corridor's
+    # edges ever become python objects. weights replaces csr['optimal'], e.g. with
+    # a column of utils/time_costs.py's table
+    def __init__(self, csr, positions, weights=None):
+        indptr, indices = csr['indptr'], csr['indices']
+        optimal = csr['optimal'] if weights is None else weights
+        self.positions = positions = np.unique(np.asarray(positions, dtype=np.int64))
+
+        edges, counts = _out_edges(indptr, positions)
+        inside = np.zeros(len(csr['nodes']), dtype=bool)
+        inside[positions] = True
+        keep = inside[indices[edges]] & ~np.isnan(optimal[edges])
+
+        # edges come out grouped by source position, in the order of positions
+        self.sources = np.repeat(positions, counts)[keep]
+        self.targets = indices[edges][keep].astype(np.int64)
+        weights = optimal[edges][keep]
+        self.w_max = float(weights.max()) if len(weights) else 0.0
+
+        nbrs = list(zip(self.targets.tolist(), weights.tolist()))
+        bounds = np.searchsorted(self.sources, positions).tolist() + [len(nbrs)]
+        self.adjacency = {node: nbrs[bounds[i]:bounds[i + 1]] for i, node in enumerate(positions.tolist())}
+
+    def hops_to_target(self, end):
+        # fewest edges from every corridor node to end, the dist of
+        # utils.search.max_avg_path, from a breadth-first search over the reversed
+        # corridor in scipy
+        if end not in self.adjacency:
+            return {end: 0}
+        n_nodes = len(self.positions)
+        reverse = csr_matrix(
+            (np.ones(len(self.sources)), (np.searchsorted(self.positions, self.targets), np.searchsorted(self.positions, self.sources))),
+            shape=(n_nodes, n_nodes),
+        )
+        hops = shortest_path(reverse, directed=True, unweighted=True, indices=int(np.searchsorted(self.positions, end)))
+        reached = np.isfinite(hops)
+        return dict(zip(self.positions[reached].tolist(), hops[reached].astype(np.int64).tolist()))
@@ -0,0 +1,54 @@
+import numpy as np
+
+# undirected lookup from a node pair to its row in roads_gdf / the edge arrays.
+# node ids are mapped to dense positions so a pair packs into one int64, and the
+# packed pairs are kept sorted, so a whole path resolves with two searchsorted calls.
+#
+# a pair (a, b) resolves to the a -> b edge when there is one, otherwise to b -> a;
+# among parallel edges the lowest key wins.
+
+
+def build_edge_index(edge_weights):
+    u, v, key = (np.asarray(edge_weights[name]) for name in ('u', 'v', 'key'))
+    nodes = np.unique(np.concatenate([u, v]))
+    n_nodes = len(nodes)
+    u_pos, v_pos = np.searchsorted(nodes, u), np.searchsorted(nodes, v)
+    rows = np.arange(len(u))
+
+    # forward pairs rank before reverse ones, then by key, so the first entry per
+    # packed pair is the one to keep
+    pairs = np.concatenate([u_pos * n_nodes + v_pos, v_pos * n_nodes + u_pos])
+    direction = np.repeat([0, 1], len(u))
+    order = np.lexsort((np.tile(key, 2), direction, pairs))
+    pairs, first = np.unique(pairs[order], return_index=True)
+
+    return {
+        'nodes': nodes,
+        'pairs': pairs,
+        'rows': np.tile(rows, 2)[order][first],
+    }
+
+
+def node_positions(edge_index, node_ids):
+    nodes = edge_index['nodes']
+    node_ids = np.asarray(node_ids, dtype=np.int64)
+    positions = np.searchsorted(nodes, node_ids).clip(max=len(nodes) - 1)
+    return np.where(nodes[positions] == node_ids, positions, -1)
+
+
+def pair_rows(edge_index, sources, targets):
+    # row of each (source, target) pair, -1 where the graph has no such edge
+    n_nodes = len(edge_index['nodes'])
+    sources, targets = node_positions(edge_index, sources), node_positions(edge_index, targets)
+    pairs = sources * n_nodes + targets
+
+    positions = np.searchsorted(edge_index['pairs'], pairs).clip(max=len(edge_index['pairs']) - 1)
+    found = (edge_index['pairs'][positions] == pairs) & (sources >= 0) & (targets >= 0)
+    return np.where(found, edge_index['rows'][positions], -1)
+
+
+def path_edge_rows(edge_index, path):
+    path = np.asarray(path, dtype=np.int64)
+    if len(path) < 2:
+        return np.empty(0, dtype=np.int64)
+    return pair_rows(edge_index, path[:-1], path[1:])
@@ -0,0 +1,101 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+
+from utils.graph_store import GRAPH_DIR
+from utils.geodesic import geographic_lengths
+
+# per-edge arrays aligned with the rows of roads_gdf (edge index i is row i), so the
+# optimal_features join runs once and routing just indexes into arrays. they are
+# stored as .npy files next to the graph snapshot and memory-mapped on load,
+# with a fingerprint of the optimal_features they were joined with, so a changed
+# features file rebuilds them.
+
+logger = logging.getLogger(__name__)
+
+EDGE_WEIGHTS_PATH = os.path.join(GRAPH_DIR, 'edge_weights')
+EDGE_ARRAYS = ('u', 'v', 'key', 'optimal', 'length', 'fingerprint')
+
+
+def features_fingerprint(features):
+    optimal = pd.to_numeric(features['optimal'], errors='coerce').to_numpy(dtype=np.float64)
+    osmids = features.index.to_numpy(dtype=np.int64)
+    return np.array([len(optimal), np.nansum(optimal), np.nansum(optimal * (osmids % 2**16))], dtype=np.float64)
+
+
+def build_edge_weights(roads_gdf, features):
+    u = roads_gdf.index.get_level_values(0).to_numpy(dtype=np.int64)
+    v = roads_gdf.index.get_level_values(1).to_numpy(dtype=np.int64)
+    key = roads_gdf.index.get_level_values(2).to_numpy(dtype=np.int64)
+
+    # an edge can carry several osmids; its optimality is the mean of the known ones
+    osmids = roads_gdf['osmid'].reset_index(drop=True).explode()
+    optimal = pd.to_numeric(osmids.map(features['optimal']), errors='coerce').groupby(level=0).mean()
+
+    # great-circle length along the geometry, checked against osmnx's own length
+    length = geographic_lengths(roads_gdf.geometry.to_numpy())
+    if 'length' in roads_gdf:
+        osmnx_length = roads_gdf['length'].to_numpy(dtype=np.float64)
+        mismatched = ~np.isclose(length, osmnx_length, rtol=0.01, atol=0.5)
+        if mismatched.any():
+            logger.warning('%d edge lengths differ from osmnx by more than 1%%', mismatched.sum())
+
+    return {
+        'u': u,
+        'v': v,
+        'key': key,
+        'optimal': optimal.reindex(range(len(roads_gdf))).to_numpy(dtype=np.float64),
+        'length': length,
+        'fingerprint': features_fingerprint(features),
+    }
+
+
+def save_edge_weights(edge_weights, path=EDGE_WEIGHTS_PATH):
+    os.makedirs(path, exist_ok=True)
+    for name in EDGE_ARRAYS:
+        np.save(os.path.join(path, f'{name}.npy'), edge_weights[name])
+
+
+def load_edge_weights(path=EDGE_WEIGHTS_PATH):
+    return {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in EDGE_ARRAYS}
+
+
+def _exists(path):
+    return all(os.path.exists(os.path.join(path, f'{name}.npy')) for name in EDGE_ARRAYS)
+
+
+def matches_roads(edge_weights, roads_gdf):
+    if len(edge_weights['u']) != len(roads_gdf):
+        return False
+    return all(
+        np.array_equal(edge_weights[name], roads_gdf.index.get_level_values(level))
+        for level, name in enumerate(('u', 'v', 'key'))
+    )
+
+
+def load_or_build_edge_weights(roads_gdf, features, path=EDGE_WEIGHTS_PATH):
+    # path=None builds them without touching disk
+    if path is not None and _exists(path):
+        edge_weights = load_edge_weights(path)
+        if matches_roads(edge_weights, roads_gdf) and np.array_equal(
+            edge_weights['fingerprint'], features_fingerprint(features)
+        ):
+            return edge_weights
+        logger.info('Edge weights at %s do not match the graph or optimal_features, rebuilding', path)
+
+    edge_weights = build_edge_weights(roads_gdf, features)
+    if path is not None:
+        save_edge_weights(edge_weights, path)
+    return edge_weights
+
+
+def edge_optimal_lookup(edge_weights):
+    # (u, v) -> optimality, keeping the best of any parallel edges
+    lookup = {}
+    for u, v, optimal in zip(edge_weights['u'].tolist(), edge_weights['v'].tolist(), edge_weights['optimal'].tolist()):
+        if np.isnan(optimal):
+            continue
+        if optimal > lookup.get((u, v), -np.inf):
+            lookup[(u, v)] = optimal
+    return lookup
@@ -0,0 +1,183 @@
+import os
+import re
+import json
+import bisect
+import difflib
+import tempfile
+import threading
+import unicodedata
+import numpy as np
+import shapely
+import osmnx as ox
+
+from utils.metrics import metrics
+
+# resolves search text to (lat, lon) without the network where possible:
+#   1. "lat,lon" typed directly
+#   2. answers remembered in a json cache on disk
+#   3. a gazetteer of the street and node names inside the graph (exact, then
+#      prefix, then fuzzy match)
+#   4. the fallback geocoder (Nominatim by default), whose answers are cached
+#
+# tests and offline tools can pass fallback=None or their own function. a fallback
+# that cannot be reached raises GeocoderUnavailable, one that answers with an
+# error GeocoderError, so callers can tell them from a query nothing matches.
+
+LATLON_PATTERN = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$')
+FUZZY_CUTOFF = 0.85
+
+
+def normalize(text):
+    return ' '.join(unicodedata.normalize('NFKC', str(text)).casefold().split())
+
+
+def parse_latlon(query):
+    match = LATLON_PATTERN.match(str(query))
+    if match is None:
+        return None
+    lat, lon = float(match.group(1)), float(match.group(2))
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+class GeocoderError(Exception):
+    pass
+
+
+class GeocoderUnavailable(GeocoderError):
+    pass
+
+
+def nominatim_geocode(query):
+    try:
+        return ox.geocode(query)
+    except ox._errors.ResponseStatusCodeError as e:
+        raise GeocoderError(f'Nominatim answered {query!r} with an error: {e}') from e
+
+
+def _names(value):
+    if isinstance(value, list):
+        return [name for name in value if isinstance(name, str)]
+    return [value] if isinstance(value, str) else []
+
+
+def build_gazetteer(nodes_gdf, roads_gdf):
+    # every named node and every named edge's midpoint; a name that appears on many
+    # edges is placed at the point closest to the middle of all of them
+    points = {}
+
+    if 'name' in nodes_gdf:
+        for value, x, y in zip(nodes_gdf['name'], nodes_gdf['x'], nodes_gdf['y']):
+            for name in _names(value):
+                points.setdefault(normalize(name), []).append((y, x))
+
+    if 'name' in roads_gdf:
+        midpoints = shapely.line_interpolate_point(roads_gdf.geometry.to_numpy(), 0.5, normalized=True)
+        for value, x, y in zip(roads_gdf['name'], shapely.get_x(midpoints), shapely.get_y(midpoints)):
+            for name in _names(value):
+                points.setdefault(normalize(name), []).append((y, x))
+
+    names = sorted(points)
+    locations = []
+    for name in names:
+        candidates = np.array(points[name])
+        center = candidates.mean(axis=0)
+        lat, lon = candidates[np.argmin(((candidates - center) ** 2).sum(axis=1))]
+        locations.append((float(lat), float(lon)))
+
+    return {'names': names, 'locations': locations}
+
+
+class Geocoder:
+    def __init__(self, gazetteer=None, cache_path=None, fallback=nominatim_geocode):
+        # gazetteer may be a zero-argument callable, so it is only built when needed
+        self._gazetteer = gazetteer
+        self.cache_path = cache_path
+        self.fallback = fallback
+        self._cache = None
+        self._lock = threading.Lock()
+
+    @property
+    def gazetteer(self):
+        if callable(self._gazetteer):
+            self._gazetteer = self._gazetteer()
+        return self._gazetteer
+
+    def _read_cache_file(self):
+        # a missing or unreadable file (e.g. a torn write) counts as empty
+        if self.cache_path is None:
+            return {}
+        try:
+            with open(self.cache_path) as f:
+                return {key: tuple(value) for key, value in json.load(f).items()}
+        except (OSError, ValueError, TypeError, AttributeError):
+            return {}
+
+    def _load_cache(self):
+        if self._cache is None:
+            self._cache = self._read_cache_file()
+        return self._cache
+
+    def _remember(self, key, location):
+        # other processes (utils/service.py workers) share the file, so their
+        # entries are merged in first, and the file is replaced in one rename
+        # so a reader never sees it half written
+        with self._lock:
+            self._cache = {**self._read_cache_file(), **self._load_cache(), key: location}
+            if self.cache_path is None:
+                return
+            directory = os.path.dirname(self.cache_path) or '.'
+            os.makedirs(directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.tmp', delete=False) as f:
+                json.dump(self._cache, f, ensure_ascii=False)
+            os.replace(f.name, self.cache_path)
+
+    def lookup(self, query):
+        # local resolution only; None when the network would be needed
+        location = parse_latlon(query)
+        if location is not None:
+            return location
+
+        key = normalize(query)
+        if not key:
+            return None
+
+        with self._lock:
+            location = self._load_cache().get(key)
+        if location is not None:
+            return location
+
+        gazetteer = self.gazetteer
+        if not gazetteer:
+            return None
+        names, locations = gazetteer['names'], gazetteer['locations']
+
+        i = bisect.bisect_left(names, key)
+        if i < len(names) and names[i].startswith(key):
+            # exact match sorts first; otherwise the shortest name with this prefix
+            end = bisect.bisect_right(names, key + '\uffff', lo=i)
+            best = min(range(i, end), key=lambda j: len(names[j]))
+            return locations[best]
+
+        close = difflib.get_close_matches(key, names, n=1, cutoff=FUZZY_CUTOFF)
+        if close:
+            return locations[bisect.bisect_left(names, close[0])]
+
+        return None
+
+    def geocode(self, query):
+        location = self.lookup(query)
+        if location is not None:
+            metrics.count('geocode.local')
+        if location is not None or self.fallback is None:
+            return location
+
+        metrics.count('geocode.fallback')
+        try:
+            location = tuple(self.fallback(query))
+        except OSError as e:
+            # requests' connection errors and timeouts are OSErrors too
+            raise GeocoderUnavailable(f'geocoder unreachable for {query!r}: {e}') from e
+        self._remember(normalize(query), location)
+        return location
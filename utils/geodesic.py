@@ -0,0 +1,32 @@
+import numpy as np
+import shapely
+
+# great-circle lengths with the same earth radius as geopy's great_circle (and
+# osmnx), computed for whole arrays of geometries at once
+
+EARTH_RADIUS_M = 6371009
+LINE_TYPES = (shapely.GeometryType.LINESTRING, shapely.GeometryType.MULTILINESTRING)
+
+
+def haversine(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def geographic_lengths(geoms):
+    # lengths in meters of lon/lat LineStrings or MultiLineStrings; the parts of a
+    # MultiLineString are measured separately and summed
+    geoms = np.asarray(geoms, dtype=object)
+    supported = np.isin(shapely.get_type_id(geoms), LINE_TYPES)
+    if not supported.all():
+        bad = geoms[~supported][0]
+        raise TypeError(f"Unsupported geometry type: {type(bad)}. Expected LineString or MultiLineString.")
+
+    parts, part_geom = shapely.get_parts(geoms, return_index=True)
+    coords, coord_part = shapely.get_coordinates(parts, return_index=True)
+
+    same_part = coord_part[:-1] == coord_part[1:]
+    segments = haversine(coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1])[same_part]
+
+    return np.bincount(part_geom[coord_part[:-1][same_part]], weights=segments, minlength=len(geoms))
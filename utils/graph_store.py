@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import logging
+import geopandas as gpd
+import osmnx as ox
+
+# local snapshot of the bike network: nodes and edges as geoparquet plus a small
+# meta.json, so startup does not depend on Overpass. the snapshot is rebuilt from a
+# download only when it is missing or was taken for a different bbox.
+#
+# build it ahead of time with: python -m utils.graph_store
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = 'utils/datasets/cache'
+GRAPH_DIR = os.path.join(CACHE_DIR, 'graph')
+
+NETWORK_TYPE = 'bike'
+
+# nodes and edges (roads)
+north, east = 35.703152, 139.772041
+south, west = 35.691657, 139.758834
+BBOX = (east, south, west, north)
+
+
+def _meta_path(path):
+    return os.path.join(path, 'meta.json')
+
+
+def _list_columns(gdf):
+    return [
+        column for column in gdf.columns
+        if gdf[column].dtype == object and gdf[column].map(lambda value: isinstance(value, list)).any()
+    ]
+
+
+def _encode(gdf, columns):
+    gdf = gdf.copy()
+    for column in columns:
+        gdf[column] = gdf[column].map(json.dumps)
+    return gdf
+
+
+def _decode(gdf, columns):
+    for column in columns:
+        gdf[column] = gdf[column].map(json.loads)
+    return gdf
+
+
+def save_snapshot(nodes_gdf, roads_gdf, bbox, path=GRAPH_DIR):
+    os.makedirs(path, exist_ok=True)
+
+    # osmnx mixes scalars and lists in columns like osmid and name, which parquet
+    # cannot store as-is, so those columns are round-tripped through json
+    node_lists, road_lists = _list_columns(nodes_gdf), _list_columns(roads_gdf)
+    _encode(nodes_gdf, node_lists).to_parquet(os.path.join(path, 'nodes.parquet'))
+    _encode(roads_gdf, road_lists).to_parquet(os.path.join(path, 'edges.parquet'))
+
+    with open(_meta_path(path), 'w') as f:
+        json.dump({
+            'bbox': list(bbox),
+            'network_type': NETWORK_TYPE,
+            'crs': str(nodes_gdf.crs),
+            'node_list_columns': node_lists,
+            'edge_list_columns': road_lists,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }, f, indent=2)
+
+
+def snapshot_matches(bbox, path=GRAPH_DIR):
+    if not os.path.exists(_meta_path(path)):
+        return False
+    with open(_meta_path(path)) as f:
+        meta = json.load(f)
+    return meta['bbox'] == list(bbox) and meta['network_type'] == NETWORK_TYPE
+
+
+def snapshot_created(path=GRAPH_DIR):
+    # when the snapshot at path was written, None without one
+    if not os.path.exists(_meta_path(path)):
+        return None
+    with open(_meta_path(path)) as f:
+        return json.load(f).get('created')
+
+
+def load_snapshot_gdfs(path=GRAPH_DIR):
+    with open(_meta_path(path)) as f:
+        meta = json.load(f)
+
+    nodes_gdf = gpd.read_parquet(os.path.join(path, 'nodes.parquet'), memory_map=True)
+    roads_gdf = gpd.read_parquet(os.path.join(path, 'edges.parquet'), memory_map=True)
+    nodes_gdf = _decode(nodes_gdf, meta['node_list_columns'])
+    roads_gdf = _decode(roads_gdf, meta['edge_list_columns'])
+    return nodes_gdf, roads_gdf
+
+
+def load_snapshot(path=GRAPH_DIR):
+    nodes_gdf, roads_gdf = load_snapshot_gdfs(path)
+    G = ox.graph_from_gdfs(nodes_gdf, roads_gdf, graph_attrs={'crs': str(nodes_gdf.crs)})
+    return G, nodes_gdf, roads_gdf
+
+
+def download_graph(bbox):
+    G = ox.graph_from_bbox(bbox, network_type=NETWORK_TYPE, simplify=False)
+    nodes_gdf, roads_gdf = ox.graph_to_gdfs(G, nodes=True, edges=True)
+    return G, nodes_gdf, roads_gdf
+
+
+def load_graph(bbox, path=GRAPH_DIR):
+    if snapshot_matches(bbox, path):
+        return load_snapshot(path)
+
+    logger.info('No graph snapshot for %s at %s, downloading', bbox, path)
+    G, nodes_gdf, roads_gdf = download_graph(bbox)
+    save_snapshot(nodes_gdf, roads_gdf, bbox, path)
+    return G, nodes_gdf, roads_gdf
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    G, nodes_gdf, roads_gdf = download_graph(BBOX)
+    save_snapshot(nodes_gdf, roads_gdf, BBOX)
+    logger.info('Saved %d nodes and %d edges to %s', len(nodes_gdf), len(roads_gdf), GRAPH_DIR)
@@ -0,0 +1,101 @@
+import numpy as np
+import shapely
+
+from utils.edge_index import path_edge_rows
+
+# street-level images grouped by the OSM way they were matched to, each group
+# ordered by where the image sits along the way's geometry. every edge row also
+# knows which way it belongs to and where its two ends sit along that way, so the
+# images for a route come out of a few array gathers.
+
+
+def _first_osmid(value, known):
+    # edges can carry several osmids; use the first one that has images
+    if isinstance(value, list):
+        for osmid in value:
+            if osmid in known:
+                return osmid
+        return value[0] if value else -1
+    return value
+
+
+def build_image_index(images_matches, features, nodes_gdf, roads_gdf, edge_weights):
+    way_geoms = shapely.from_wkb(features['geometry'].to_numpy())
+    way_position = {osmid: i for i, osmid in enumerate(features.index)}
+
+    image_ids = images_matches.index.to_numpy()
+    image_osmids = images_matches['osmid'].to_numpy()
+    has_way = np.array([osmid in way_position for osmid in image_osmids], dtype=bool)
+    image_ids, image_osmids = image_ids[has_way], image_osmids[has_way]
+    image_points = images_matches.geometry.to_numpy()[has_way]
+
+    image_geoms = way_geoms[[way_position[osmid] for osmid in image_osmids]]
+    positions = shapely.line_locate_point(image_geoms, image_points)
+
+    order = np.lexsort((positions, image_osmids))
+    image_ids, image_osmids = image_ids[order], image_osmids[order]
+    osmids, starts = np.unique(image_osmids, return_index=True)
+    offsets = np.append(starts, len(image_ids))
+
+    # per edge row: which way (position in osmids) and where u and v sit along it
+    known = set(osmids.tolist())
+    edge_osmids = np.array([_first_osmid(value, known) for value in roads_gdf['osmid']], dtype=np.int64)
+    edge_way = np.full(len(edge_osmids), -1)
+    if len(osmids):
+        candidates = np.searchsorted(osmids, edge_osmids).clip(max=len(osmids) - 1)
+        edge_way = np.where(osmids[candidates] == edge_osmids, candidates, -1)
+
+    u_position = np.full(len(edge_way), np.nan)
+    v_position = np.full(len(edge_way), np.nan)
+    rows = np.flatnonzero(edge_way >= 0)
+    if len(rows):
+        geoms = way_geoms[[way_position[osmid] for osmid in osmids[edge_way[rows]]]]
+        xy = nodes_gdf[['x', 'y']]
+        u_points = shapely.points(xy.loc[np.asarray(edge_weights['u'])[rows]].to_numpy())
+        v_points = shapely.points(xy.loc[np.asarray(edge_weights['v'])[rows]].to_numpy())
+        u_position[rows] = shapely.line_locate_point(geoms, u_points)
+        v_position[rows] = shapely.line_locate_point(geoms, v_points)
+
+    return {
+        'osmids': osmids,
+        'offsets': offsets,
+        'image_ids': image_ids,
+        'edge_way': edge_way,
+        'u_position': u_position,
+        'v_position': v_position,
+    }
+
+
+def route_image_ids(image_index, edge_index, edge_weights, path):
+    # for every run of consecutive edges on the same way, the way's first and last
+    # image in the direction of travel
+    path = np.asarray(path, dtype=np.int64)
+    rows = path_edge_rows(edge_index, path)
+    found = rows >= 0
+    sources, targets, rows = path[:-1][found], path[1:][found], rows[found]
+
+    ways = image_index['edge_way'][rows]
+    with_images = ways >= 0
+    sources, targets, rows, ways = sources[with_images], targets[with_images], rows[with_images], ways[with_images]
+    if len(ways) == 0:
+        return []
+
+    run_starts = np.flatnonzero(np.r_[True, ways[1:] != ways[:-1]])
+    run_ends = np.r_[run_starts[1:], len(ways)] - 1
+
+    def position_of(nodes, run_rows):
+        at_u = np.asarray(edge_weights['u'])[run_rows] == nodes
+        return np.where(at_u, image_index['u_position'][run_rows], image_index['v_position'][run_rows])
+
+    entry = position_of(sources[run_starts], rows[run_starts])
+    exit = position_of(targets[run_ends], rows[run_ends])
+    forward = exit >= entry
+
+    run_ways = ways[run_starts]
+    first = image_index['offsets'][run_ways]
+    last = image_index['offsets'][run_ways + 1] - 1
+    picks = np.column_stack([np.where(forward, first, last), np.where(forward, last, first)]).ravel()
+
+    image_ids = image_index['image_ids'][picks]
+    keep = np.r_[True, image_ids[1:] != image_ids[:-1]]
+    return image_ids[keep].tolist()
@@ -0,0 +1,70 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# route computations run off the Streamlit script thread. generate_map and
+# compute_route take a progress callback that is called as each stage starts; a
+# job's callback records the stage and raises Cancelled once the job has been
+# cancelled, so a superseded search stops at its next stage instead of running to
+# the end.
+
+ROUTE_STAGES = ('geocode', 'snap', 'shortest', 'corridor search', 'alternatives', 'details', 'render')
+
+
+class Cancelled(Exception):
+    pass
+
+
+class RouteJob:
+    def __init__(self, stages=ROUTE_STAGES):
+        self.stages = stages
+        self.stage = None
+        self.timings = {}
+        self.future = None
+        self._cancelled = threading.Event()
+        self._stage_started = None
+
+    def progress(self, stage):
+        if self._cancelled.is_set():
+            raise Cancelled(stage)
+
+        now = time.perf_counter()
+        if self.stage is not None:
+            self.timings[self.stage] = now - self._stage_started
+        self.stage, self._stage_started = stage, now
+
+    @property
+    def fraction(self):
+        # share of the stages started so far; skipped stages (e.g. on a cache hit) jump ahead
+        if self.stage not in self.stages:
+            return 0.0
+        return self.stages.index(self.stage) / len(self.stages)
+
+    def cancel(self):
+        self._cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def done(self):
+        return self.future is not None and self.future.done()
+
+    def result(self, timeout=None):
+        result = self.future.result(timeout)
+        if self.stage is not None:
+            self.timings[self.stage] = time.perf_counter() - self._stage_started
+        return result
+
+
+class RouteRunner:
+    def __init__(self, workers=4):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='route')
+
+    def submit(self, fn, *args, **kwargs):
+        # fn must accept progress=; the returned job reports its stage and can be cancelled
+        job = RouteJob()
+        job.future = self._executor.submit(fn, *args, progress=job.progress, **kwargs)
+        return job
@@ -0,0 +1,245 @@
+import os
+import heapq
+import logging
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from utils.graph_store import GRAPH_DIR
+from utils.metrics import metrics
+
+# optional preprocessing for point-to-point shortest paths on large graphs (ALT:
+# A*, landmarks and the triangle inequality). a few landmarks spread over the
+# graph store their distance to and from every node, which gives every node a
+# lower bound on its distance to any target. queries run a bidirectional A*
+# guided by those bounds, so they settle a narrow band around the route instead of
+# the whole disc a plain Dijkstra grows.
+#
+# tables are built per cost metric, saved as .npy files next to the graph snapshot
+# and memory-mapped on load:
+#   length    meters
+#   weighted  meters stretched by how far an edge is from optimal, so the
+#             cheapest route prefers well-rated streets
+#
+#   python -m utils.landmarks
+
+logger = logging.getLogger(__name__)
+
+LANDMARKS_PATH = os.path.join(GRAPH_DIR, 'landmarks')
+COST_METRICS = ('length', 'weighted')
+LANDMARK_ARRAYS = (
+    'nodes', 'indptr', 'indices', 'costs', 'r_indptr', 'r_indices', 'r_costs',
+    'landmarks', 'from_landmarks', 'to_landmarks', 'fingerprint',
+)
+
+
+def edge_costs(edge_weights, metric='length', penalty=1.0):
+    length = np.asarray(edge_weights['length'], dtype=np.float64)
+    if metric == 'length':
+        return length
+    if metric == 'weighted':
+        optimal = np.nan_to_num(np.asarray(edge_weights['optimal'], dtype=np.float64))
+        return length * (1 + penalty * (1 - optimal))
+    raise ValueError(f'Unknown cost metric: {metric}. Expected one of {COST_METRICS}')
+
+
+def _fingerprint(edge_weights, costs):
+    return np.array([len(costs), costs.sum(), np.asarray(edge_weights['u']).sum() % 2**31], dtype=np.float64)
+
+
+def _graph(edge_weights, costs):
+    # directed graph over dense node positions; parallel edges keep the cheapest
+    u, v = np.asarray(edge_weights['u']), np.asarray(edge_weights['v'])
+    nodes = np.unique(np.concatenate([u, v]))
+    u_pos, v_pos = np.searchsorted(nodes, u), np.searchsorted(nodes, v)
+
+    order = np.lexsort((costs, v_pos, u_pos))
+    u_pos, v_pos, costs = u_pos[order], v_pos[order], costs[order]
+    first = np.r_[True, (u_pos[1:] != u_pos[:-1]) | (v_pos[1:] != v_pos[:-1])]
+
+    graph = csr_matrix((costs[first], (u_pos[first], v_pos[first])), shape=(len(nodes), len(nodes)))
+    return nodes, graph
+
+
+def _select_landmarks(graph, n_landmarks, seed):
+    # farthest-point selection: each new landmark is the node farthest (in either
+    # direction) from the ones already chosen
+    rng = np.random.default_rng(seed)
+    undirected = graph.maximum(graph.T)
+    landmarks = [int(rng.integers(graph.shape[0]))]
+    distances = dijkstra(undirected, indices=landmarks[0])
+    landmarks = [int(np.argmax(np.where(np.isfinite(distances), distances, -1)))]
+
+    distances = dijkstra(undirected, indices=landmarks[0])
+    while len(landmarks) < n_landmarks:
+        candidate = int(np.argmax(np.where(np.isfinite(distances), distances, -1)))
+        if candidate in landmarks:
+            break
+        landmarks.append(candidate)
+        distances = np.minimum(distances, dijkstra(undirected, indices=candidate))
+    return np.array(landmarks)
+
+
+def build_landmarks(edge_weights, metric='length', n_landmarks=8, seed=0):
+    costs = edge_costs(edge_weights, metric)
+    nodes, graph = _graph(edge_weights, costs)
+    reverse = graph.T.tocsr()
+
+    landmarks = _select_landmarks(graph, n_landmarks, seed)
+    return {
+        'nodes': nodes,
+        'indptr': graph.indptr, 'indices': graph.indices, 'costs': graph.data,
+        'r_indptr': reverse.indptr, 'r_indices': reverse.indices, 'r_costs': reverse.data,
+        'landmarks': landmarks,
+        # (nodes, landmarks): d(landmark, node) and d(node, landmark)
+        'from_landmarks': np.ascontiguousarray(dijkstra(graph, indices=landmarks).T),
+        'to_landmarks': np.ascontiguousarray(dijkstra(reverse, indices=landmarks).T),
+        'fingerprint': _fingerprint(edge_weights, costs),
+    }
+
+
+def save_landmarks(tables, path):
+    os.makedirs(path, exist_ok=True)
+    for name in LANDMARK_ARRAYS:
+        np.save(os.path.join(path, f'{name}.npy'), tables[name])
+
+
+def load_landmarks(path):
+    return {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in LANDMARK_ARRAYS}
+
+
+def _exists(path):
+    return all(os.path.exists(os.path.join(path, f'{name}.npy')) for name in LANDMARK_ARRAYS)
+
+
+def load_or_build_landmarks(edge_weights, metric='length', path=LANDMARKS_PATH, n_landmarks=8):
+    # path=None builds them without touching disk
+    if path is None:
+        return build_landmarks(edge_weights, metric, n_landmarks)
+
+    path = os.path.join(path, metric)
+    if _exists(path):
+        tables = load_landmarks(path)
+        if np.array_equal(tables['fingerprint'], _fingerprint(edge_weights, edge_costs(edge_weights, metric))):
+            return tables
+        logger.info('Landmarks at %s do not match the edge weights, rebuilding', path)
+
+    tables = build_landmarks(edge_weights, metric, n_landmarks)
+    save_landmarks(tables, path)
+    return tables
+
+
+def _query_lists(tables):
+    # the search loop indexes plain lists, which is several times faster than
+    # indexing numpy arrays one element at a time
+    if '_lists' not in tables:
+        tables['_lists'] = tuple(
+            np.asarray(tables[name]).tolist()
+            for name in ('indptr', 'indices', 'costs', 'r_indptr', 'r_indices', 'r_costs')
+        )
+    return tables['_lists']
+
+
+def _lower_bounds(tables, target, reverse=False):
+    # d(v, target) >= d(L, target) - d(L, v) and d(v, target) >= d(v, L) - d(target, L);
+    # with reverse, bounds on d(target, v) instead
+    from_landmarks, to_landmarks = tables['from_landmarks'], tables['to_landmarks']
+    if reverse:
+        from_landmarks, to_landmarks = to_landmarks, from_landmarks
+    from_target, to_target = from_landmarks[target].tolist(), to_landmarks[target].tolist()
+    bounds = {}
+
+    def bound(node):
+        if node not in bounds:
+            value = 0.0
+            for a, b in zip(from_target, from_landmarks[node].tolist()):
+                if a - b > value:
+                    value = a - b
+            for a, b in zip(to_landmarks[node].tolist(), to_target):
+                if a - b > value:
+                    value = a - b
+            # unreachable landmarks give inf - inf (never > value) or inf; inf
+            # means no route to target, which the search finds out by itself
+            bounds[node] = value if value != np.inf else 0.0
+        return bounds[node]
+
+    return bound
+
+
+def alt_shortest_path(tables, source, target):
+    # (path of node ids, cost), or (None, inf) when target cannot be reached
+    nodes = tables['nodes']
+    s, t = (int(np.searchsorted(nodes, node)) for node in (source, target))
+    if s >= len(nodes) or t >= len(nodes) or nodes[s] != source or nodes[t] != target:
+        raise KeyError(f'{source if s >= len(nodes) or nodes[s] != source else target} is not in the graph')
+    if s == t:
+        return [source], 0.0
+
+    indptr, indices, costs, r_indptr, r_indices, r_costs = _query_lists(tables)
+    to_target, from_source = _lower_bounds(tables, t), _lower_bounds(tables, s, reverse=True)
+
+    # average potentials keep both directions consistent with each other
+    def potential(node):
+        return (to_target(node) - from_source(node)) / 2
+
+    sides = (
+        {'dist': {s: 0.0}, 'parent': {s: -1}, 'heap': [(potential(s), s)], 'sign': 1,
+         'adj': (indptr, indices, costs)},
+        {'dist': {t: 0.0}, 'parent': {t: -1}, 'heap': [(-potential(t), t)], 'sign': -1,
+         'adj': (r_indptr, r_indices, r_costs)},
+    )
+    settled = (set(), set())
+    best, meeting = np.inf, -1
+    pushes = 0
+
+    while sides[0]['heap'] and sides[1]['heap']:
+        if sides[0]['heap'][0][0] + sides[1]['heap'][0][0] >= best:
+            break
+
+        side = 0 if len(sides[0]['heap']) <= len(sides[1]['heap']) else 1
+        this, other = sides[side], sides[1 - side]
+        _, node = heapq.heappop(this['heap'])
+        if node in settled[side]:
+            continue
+        settled[side].add(node)
+
+        node_dist = this['dist'][node]
+        ptr, idx, cost = this['adj']
+        for i in range(ptr[node], ptr[node + 1]):
+            neighbor, new_dist = idx[i], node_dist + cost[i]
+            if new_dist < this['dist'].get(neighbor, np.inf):
+                this['dist'][neighbor] = new_dist
+                this['parent'][neighbor] = node
+                heapq.heappush(this['heap'], (new_dist + this['sign'] * potential(neighbor), neighbor))
+                pushes += 1
+                if neighbor in other['dist'] and new_dist + other['dist'][neighbor] < best:
+                    best, meeting = new_dist + other['dist'][neighbor], neighbor
+
+    metrics.count('alt.settled', len(settled[0]) + len(settled[1]))
+    metrics.count('alt.pushes', pushes)
+    if meeting < 0:
+        return None, np.inf
+
+    path = []
+    node = meeting
+    while node >= 0:
+        path.append(node)
+        node = sides[0]['parent'][node]
+    path = path[::-1]
+    node = sides[1]['parent'][meeting]
+    while node >= 0:
+        path.append(node)
+        node = sides[1]['parent'][node]
+
+    return nodes[path].tolist(), float(best)
+
+
+if __name__ == '__main__':
+    from utils.context import data
+
+    logging.basicConfig(level=logging.INFO)
+
+    for metric in COST_METRICS:
+        tables = build_landmarks(data.edge_weights, metric)
+        save_landmarks(tables, os.path.join(LANDMARKS_PATH, metric))
+        logger.info('Saved %d %s landmarks over %d nodes to %s', len(tables['landmarks']), metric, len(tables['nodes']), LANDMARKS_PATH)
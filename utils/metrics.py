@@ -0,0 +1,94 @@
+import time
+import logging
+import threading
+import numpy as np
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# process-wide timers and counters for the routing pipeline. stages are timed
+# with `with metrics.timer('shortest'):`, searches and caches add counts with
+# metrics.count('pareto.labels', n). each search counts the labels or nodes it
+# expanded and pushed onto its queue (search.expanded and search.pushes, the same
+# under pareto., alt.settled and alt.pushes). every measurement is also passed to the
+# hooks, so it can go to a log or a metrics backend as it happens:
+#
+#   metrics.add_hook(lambda event: statsd.timing(event['name'], event['value']))
+#
+# the log hook writes each event at DEBUG to the 'utils.metrics' logger, which is
+# silent unless logging is configured for it.
+
+logger = logging.getLogger(__name__)
+
+
+def log_hook(event):
+    if event['type'] == 'timer':
+        logger.debug('%s took %.2f ms', event['name'], event['value'] * 1e3)
+    else:
+        logger.debug('%s +%d', event['name'], event['value'])
+
+
+class Metrics:
+    def __init__(self, window=1024, hooks=(log_hook,)):
+        # percentiles are over the last `window` timings of each stage
+        self.window = window
+        self.hooks = list(hooks)
+        self._timings = defaultdict(lambda: deque(maxlen=self.window))
+        self._counters = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def _emit(self, event):
+        for hook in self.hooks:
+            try:
+                hook(event)
+            except Exception as e:
+                logger.warning('metrics hook %r failed: %s', hook, e)
+
+    def record(self, name, seconds):
+        with self._lock:
+            self._timings[name].append(seconds)
+        self._emit({'type': 'timer', 'name': name, 'value': seconds})
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+        self._emit({'type': 'count', 'name': name, 'value': value})
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def summary(self):
+        with self._lock:
+            timings = {name: np.array(values) for name, values in self._timings.items()}
+            counters = dict(self._counters)
+        return {
+            'timers': {
+                name: {
+                    'count': len(values),
+                    'mean_ms': values.mean() * 1e3,
+                    'p50_ms': np.percentile(values, 50) * 1e3,
+                    'p95_ms': np.percentile(values, 95) * 1e3,
+                    'max_ms': values.max() * 1e3,
+                }
+                for name, values in timings.items() if len(values)
+            },
+            'counters': counters,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._timings.clear()
+            self._counters.clear()
+
+
+metrics = Metrics()
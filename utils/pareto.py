@@ -0,0 +1,95 @@
+import heapq
+import numpy as np
+
+from utils.metrics import metrics
+
+# routes that trade distance against optimality. every edge has two additive
+# costs: its length and its exposure, the meters ridden on it weighted by how far
+# its optimality falls short of safe_level (length * max(safe_level - optimal, 0),
+# missing optimality counts as 0). weighting every meter by 1 - optimal instead
+# makes the shortest route the least exposed one almost every time. the search
+# keeps, per node, the labels no other label beats on both costs and returns the
+# routes on the Pareto frontier between the shortest and the least exposed one.
+#
+# labels are settled in order of length plus a straight-line lower bound to the
+# target, so the first settled route is the shortest and each later one must be
+# less exposed. epsilon relaxes dominance (a label within a factor 1 + epsilon on
+# both costs counts as dominating) and max_labels caps the labels settled per
+# node; both trade frontier resolution for bounded work.
+
+
+def build_pareto_adjacency(edge_weights, safe_level=0.6):
+    # one entry per directed node pair: the lowest key, as in utils/edge_index.py
+    u, v, key = (np.asarray(edge_weights[name]) for name in ('u', 'v', 'key'))
+    length = np.asarray(edge_weights['length'], dtype=np.float64)
+    optimal = np.nan_to_num(np.asarray(edge_weights['optimal'], dtype=np.float64))
+    exposure = length * np.clip(safe_level - optimal, 0, None)
+
+    adj = {}
+    for row in np.lexsort((key, v, u)):
+        nbrs = adj.setdefault(int(u[row]), {})
+        nbrs.setdefault(int(v[row]), (float(length[row]), float(exposure[row])))
+    return {node: [(v, length, exposure) for v, (length, exposure) in nbrs.items()] for node, nbrs in adj.items()}
+
+
+def _dominated(labels, length, exposure, factor):
+    for other_length, other_exposure in labels:
+        if other_length <= length * factor and other_exposure <= exposure * factor:
+            return True
+    return False
+
+
+def pareto_paths(adj, start, end, epsilon=0.05, max_labels=8, max_routes=5, lower_bound=None):
+    # returns [(path, length, exposure)], shortest first and exposure decreasing.
+    # lower_bound(node) must never overestimate the remaining length to end.
+    if start == end:
+        return [([start], 0.0, 0.0)]
+
+    lower_bound = lower_bound or (lambda node: 0.0)
+    factor = 1 + epsilon
+
+    label_node, label_parent = [start], [-1]
+    settled = {}
+    routes = []
+    heap = [(lower_bound(start), 0.0, 0.0, 0)]
+    expanded = 0
+
+    while heap and len(routes) < max_routes:
+        estimate, length, exposure, label = heapq.heappop(heap)
+        node = label_node[label]
+
+        # nothing beyond a settled route can be shorter, so it has to be less exposed
+        if _dominated([(route_length, route_exposure) for _, route_length, route_exposure in routes],
+                      estimate, exposure, factor):
+            continue
+
+        node_labels = settled.setdefault(node, [])
+        if len(node_labels) >= max_labels or _dominated(node_labels, length, exposure, factor):
+            continue
+        node_labels.append((length, exposure))
+
+        if node == end:
+            routes.append((label, length, exposure))
+            continue
+
+        expanded += 1
+        for neighbor, edge_length, edge_exposure in adj.get(node, ()):
+            new_length, new_exposure = length + edge_length, exposure + edge_exposure
+            if _dominated(settled.get(neighbor, ()), new_length, new_exposure, factor):
+                continue
+            label_node.append(neighbor)
+            label_parent.append(label)
+            heapq.heappush(heap, (new_length + lower_bound(neighbor), new_length, new_exposure, len(label_node) - 1))
+
+    metrics.count('pareto.labels', len(label_node))
+    metrics.count('pareto.settled', sum(len(labels) for labels in settled.values()))
+    metrics.count('pareto.expanded', expanded)
+    metrics.count('pareto.pushes', len(label_node) - 1)
+    paths = []
+    for label, length, exposure in routes:
+        path = []
+        while label >= 0:
+            path.append(label_node[label])
+            label = label_parent[label]
+        paths.append((path[::-1], length, exposure))
+    return paths
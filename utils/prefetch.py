@@ -0,0 +1,51 @@
+import logging
+import threading
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# downloads slideshow images in the background and keeps the most recent ones in
+# memory, so stepping to the next/previous image only has to render bytes that are
+# already here. get() never blocks: it returns None until the download finishes.
+
+logger = logging.getLogger(__name__)
+
+
+class ImagePrefetcher:
+    def __init__(self, maxsize=64, workers=4, timeout=10):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._images = OrderedDict()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-prefetch')
+
+    def _fetch(self, url):
+        try:
+            with urllib.request.urlopen(url, timeout=self.timeout) as response:
+                image = response.read()
+        except Exception as e:
+            logger.warning('Prefetching %s failed: %s', url[:80], e)
+            image = None
+
+        with self._lock:
+            self._pending.discard(url)
+            if image is not None:
+                self._images[url] = image
+                while len(self._images) > self.maxsize:
+                    self._images.popitem(last=False)
+
+    def prefetch(self, urls):
+        for url in urls:
+            with self._lock:
+                if url is None or url in self._images or url in self._pending:
+                    continue
+                self._pending.add(url)
+            self._executor.submit(self._fetch, url)
+
+    def get(self, url):
+        with self._lock:
+            image = self._images.get(url)
+            if image is not None:
+                self._images.move_to_end(url)
+            return image
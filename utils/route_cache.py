@@ -0,0 +1,117 @@
+import os
+import json
+import sqlite3
+import threading
+import numpy as np
+from collections import OrderedDict
+
+from utils.metrics import metrics
+
+# bounded LRU of route results keyed by snapped node ids and search parameters.
+# with a path, results are also written to a small sqlite table so they survive
+# restarts; memory is checked first, then disk, then the route is computed.
+#
+# entries are kept as JSON text in both tiers, so every get returns its own copy
+# and a caller changing a result cannot change what the next one gets. the table
+# keeps the max_rows most recently written routes.
+
+
+def _to_json(value):
+    return json.dumps(value, default=lambda o: o.item() if isinstance(o, np.generic) else list(o))
+
+
+class RouteCache:
+    def __init__(self, maxsize=256, path=None, max_rows=10_000):
+        self.maxsize = maxsize
+        self.path = path
+        self.max_rows = max_rows
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if path is not None:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self._execute('CREATE TABLE IF NOT EXISTS routes (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+
+    def _execute(self, sql, params=()):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                return conn.execute(sql, params).fetchone()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(*parts):
+        return _to_json(parts)
+
+    def _remember(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            hit = key in self._entries
+            if hit:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                text = self._entries[key]
+        if hit:
+            metrics.count('route_cache.hits')
+            return json.loads(text)
+
+        if self.path is not None:
+            row = self._execute('SELECT value FROM routes WHERE key = ?', (key,))
+            if row is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key, row[0])
+                metrics.count('route_cache.disk_hits')
+                return json.loads(row[0])
+
+        with self._lock:
+            self.misses += 1
+        metrics.count('route_cache.misses')
+        return None
+
+    def put(self, key, value):
+        text = _to_json(value)
+        with self._lock:
+            self._remember(key, text)
+
+        if self.path is not None:
+            # a replaced row gets a new rowid, so the lowest rowids are the oldest writes
+            self._execute('INSERT OR REPLACE INTO routes (key, value) VALUES (?, ?)', (key, text))
+            self._execute(
+                'DELETE FROM routes WHERE rowid <= (SELECT rowid FROM routes ORDER BY rowid DESC LIMIT 1 OFFSET ?)',
+                (self.max_rows,),
+            )
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+
+        if self.path is not None:
+            self._execute('DELETE FROM routes')
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+            }
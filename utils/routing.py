@@ -1,131 +1,109 @@
-import pandas as pd
-import geopandas as gpd
 import numpy as np
-import matplotlib.pyplot as plt
 import networkx as nx
 import folium
-import json
-from shapely.ops import linemerge
-from shapely.geometry import LineString, box, MultiLineString
-from scipy.spatial import cKDTree
-from geopy.distance import great_circle
-from collections import deque
-import osmnx as ox
 import math
-
-# image_id to osmid
-images_matches = gpd.read_parquet('utils/datasets/image_matches_n_3_yolo.parquet')
-images_matches = images_matches[images_matches['pedestrians'] + images_matches['vehicles'] > 0]
-images_matches.set_index('image_id', inplace=True)
-images_matches = images_matches.to_crs("EPSG:4326")
-
-# features
-features = pd.read_parquet('utils/datasets/optimal_features.parquet')
-
-# image to url
-image_to_url = pd.read_parquet('utils/datasets/image_to_url.parquet')
-
-# nodes and edges (roads)
-north, east = 35.703152, 139.772041
-south, west = 35.691657, 139.758834
-
-G = ox.graph_from_bbox((east, south, west, north), network_type='bike', simplify=False)
-nodes_gdf, roads_gdf = ox.graph_to_gdfs(G, nodes=True, edges=True)
+import os
+import logging
+import shapely
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.search import build_adjacency, max_avg_path
+from utils.corridor import build_node_grid, nodes_in_bbox
+from utils.csr import build_csr, shortest_hop_path, position, CSRCorridor
+from utils.pareto import build_pareto_adjacency, pareto_paths
+from utils.graph_store import north, east, south, west, CACHE_DIR
+from utils.context import data, warm_up, reset
+from utils.edge_index import path_edge_rows, node_positions
+from utils.geodesic import geographic_lengths, haversine
+from utils.route_cache import RouteCache
+from utils.geocoding import Geocoder
+from utils.snapping import snap_points
+from utils.image_index import route_image_ids
+from utils.metrics import metrics
+from utils.time_costs import departure_bucket
+
+logger = logging.getLogger(__name__)
+
+# datasets load on first use, see utils/context.py
+DATASET_NAMES = (
+    'images_matches', 'features', 'image_to_url',
+    'G', 'nodes_gdf', 'roads_gdf', 'edge_weights', 'edge_optimals', 'edge_index', 'csr', 'pareto_adjacency',
+    'gazetteer', 'snapper', 'image_index', 'node_grid', 'landmarks', 'time_costs',
+)
+
+# route results shared by every caller in the process; app.py passes its own
+route_cache = RouteCache()
+
+# place names resolve from the graph's own street names first, then Nominatim
+default_geocoder = Geocoder(
+    gazetteer=lambda: data.gazetteer,
+    cache_path=os.path.join(CACHE_DIR, 'geocode_cache.json'),
+)
+
+# route lines on the map are simplified to within this many meters
+SIMPLIFY_TOLERANCE_M = 1.0
+METERS_PER_DEGREE = 111_320
+
+# geocodes the two ends of a search concurrently
+_geocode_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='geocode')
+
+def _no_progress(stage):
+    pass
+
+def __getattr__(name):
+    if name in DATASET_NAMES:
+        return getattr(data, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # helper functions
-def find_max_avg_path_pruned(G, optimal_df, start_node, end_node, max_depth=50):
-    edge_optimals = {}
-    for u, v, data in G.edges(data=True):
-        osmids = data.get('osmid', [])
-        if not isinstance(osmids, list):
-            osmids = [osmids]
-        edge_optimal = np.mean([optimal_df.loc[osmid, 'optimal'] for osmid in osmids
-                              if osmid in optimal_df.index])
-        edge_optimals[(u, v)] = edge_optimal
-
-    best_at_node = {node: (-np.inf, 0, None) for node in G.nodes()}
-    best_at_node[start_node] = (0, 0, [start_node])
-
-    queue = deque([start_node])
-
-    while queue:
-        current = queue.popleft()
-        current_avg, current_count, current_path = best_at_node[current]
-
-        for neighbor in G.neighbors(current):
-            if neighbor in current_path:
-                continue
-
-            edge_opt = edge_optimals.get((current, neighbor), 0)
-            new_count = current_count + 1
-            new_total = current_avg * current_count + edge_opt
-            new_avg = new_total / new_count
-
-            if new_avg > best_at_node[neighbor][0]:
-                new_path = current_path + [neighbor]
-                best_at_node[neighbor] = (new_avg, new_count, new_path)
-                queue.append(neighbor)
-
-    return best_at_node[end_node][2], best_at_node[end_node][0]
-
-def get_path_optimality(path):
-    optimality = 0
-
-    for source_osmid, dest_osmid in nx.utils.pairwise(path):
-        if (source_osmid, dest_osmid, 0) in roads_gdf.index:
-            osmid = roads_gdf.loc[(source_osmid, dest_osmid, 0), 'osmid']
-        elif (dest_osmid, source_osmid, 0) in roads_gdf.index:
-            osmid = roads_gdf.loc[(dest_osmid, source_osmid, 0), 'osmid']
-        else:
-            print(f'Edge between {source_osmid} and {dest_osmid} not found')
-            continue
-
-        optimality += features.loc[osmid, 'optimal'].item()
+def find_max_avg_path_pruned(G, edge_optimals, start_node, end_node, max_depth=50):
+    adj = build_adjacency(G, edge_optimals)
+    return max_avg_path(adj, start_node, end_node, max_depth=max_depth)
+
+def get_path_rows(path, context=None):
+    # rows of roads_gdf / the edge arrays along the path; pairs with no edge are dropped
+    context = data if context is None else context
+    rows = path_edge_rows(context.edge_index, path)
+    for i in np.flatnonzero(rows < 0):
+        logger.warning('Edge between %s and %s not found', path[i], path[i + 1])
+    return rows[rows >= 0]
+
+def get_path_optimality(path, context=None):
+    context = data if context is None else context
+    rows = get_path_rows(path, context)
+    optimality = float(np.nansum(context.edge_weights['optimal'][rows]))
 
     return optimality / len(path)
 
 def geographic_length(geom):
-    def calculate_linestring_length(line):
-        coords = list(line.coords)
-        total_distance = 0
-        for i in range(len(coords) - 1):
-            total_distance += great_circle(coords[i][::-1], coords[i + 1][::-1]).meters
-        return total_distance
-
-    if isinstance(geom, MultiLineString):
-        total_length = 0
-        print(geom)
-        for line in geom.geoms:
-            total_length += calculate_linestring_length(line)
-        return total_length
-
-    elif isinstance(geom, LineString):
-        return calculate_linestring_length(geom)
-
-    else:
-        raise TypeError(f"Unsupported geometry type: {type(geom)}. Expected LineString or MultiLineString.")
-
-def get_path_length(path):
-    length = 0
-
-    for source_osmid, dest_osmid in nx.utils.pairwise(path):
-        if (source_osmid, dest_osmid, 0) in roads_gdf.index:
-            geom = roads_gdf.loc[(source_osmid, dest_osmid, 0), 'geometry']
-        elif (dest_osmid, source_osmid, 0) in roads_gdf.index:
-            geom = roads_gdf.loc[(dest_osmid, source_osmid, 0), 'geometry']
-        else:
-            print(f'Edge between {source_osmid} and {dest_osmid} not found')
-            continue
-
-        length += geographic_length(geom)
-
-    return length
-
-def optimal_path_in_corridor(G, optimal_df, start_node, end_node, shortest_path, corridor_padding_percent=0.05, max_depth=50):
+    return geographic_lengths([geom])[0]
+
+def get_path_length(path, context=None):
+    context = data if context is None else context
+    return float(context.edge_weights['length'][get_path_rows(path, context)].sum())
+
+def graph_csr(G):
+    # the CSR graph (see utils/csr.py) of a graph the data context did not build,
+    # with the optimality of its edges' 'optimal' attribute
+    u, v, length, optimal = zip(*((u, v, d['length'], d.get('optimal', np.nan)) for u, v, d in G.edges(data=True)))
+    node_ids, xy = zip(*G.nodes(data=True))
+    return build_csr(
+        {'u': u, 'v': v, 'length': length, 'optimal': optimal},
+        node_ids, [d['x'] for d in xy], [d['y'] for d in xy],
+    )
+
+def optimal_path_in_corridor(G, start_node, end_node, shortest_path, corridor_padding_percent=0.05, max_depth=50,
+                             csr=None, node_grid=None, weights=None):
+    # csr and node_grid are prebuilt for G by the data context; other graphs get
+    # them built here. weights (per CSR entry) replaces the all-day optimality
+    if csr is None:
+        csr = graph_csr(G)
+    if node_grid is None:
+        node_grid = build_node_grid(csr['nodes'], csr['x'], csr['y'])
     
-    path_nodes = [G.nodes[n] for n in shortest_path]
-    lats = [node['y'] for node in path_nodes]
-    lons = [node['x'] for node in path_nodes]
+    path_positions = node_positions(csr, shortest_path)
+    lats = csr['y'][path_positions].tolist()
+    lons = csr['x'][path_positions].tolist()
     
     min_lat, max_lat = min(lats), max(lats)
     min_lon, max_lon = min(lons), max(lons)
@@ -138,29 +116,78 @@ def optimal_path_in_corridor(G, optimal_df, start_node, end_node, shortest_path,
     min_lon -= lon_width * corridor_padding_percent
     max_lon += lon_width * corridor_padding_percent
     
-    nodes_in_bbox = [
-        n for n, data in G.nodes(data=True)
-        if (min_lon <= data['x'] <= max_lon) and 
-           (min_lat <= data['y'] <= max_lat)
-    ]
-    G_sub = G.subgraph(nodes_in_bbox).copy()
-    
-    optimal_path, optimality_score = find_max_avg_path_pruned(
-        G_sub, optimal_df, start_node, end_node, max_depth
+    # the search runs on CSR positions, mapped back to node ids at the end
+    corridor = CSRCorridor(csr, node_positions(csr, nodes_in_bbox(node_grid, min_lon, min_lat, max_lon, max_lat)), weights)
+    start, end = position(csr, start_node), position(csr, end_node)
+    optimal_path, optimality_score = max_avg_path(
+        corridor.adjacency, start, end, max_depth=max_depth, dist=corridor.hops_to_target(end), w_max=corridor.w_max,
     )
+    if optimal_path is not None:
+        optimal_path = csr['nodes'][optimal_path].tolist()
     
     return optimal_path, optimality_score, (min_lon, min_lat, max_lon, max_lat)
 
-def get_shortest_and_optimal_paths(G, optimal_df, source_point, dest_point):
-    path_shortest = nx.shortest_path(G, source_point, dest_point)
-    path_practical, optimality_practical, bbox_practical = optimal_path_in_corridor(
-        G, optimal_df, source_point, dest_point, path_shortest, corridor_padding_percent=0.20
+def remaining_length_bound(G, end_node):
+    # straight-line meters to end_node, never more than the length of a route there
+    end = G.nodes[end_node]
+    bounds = {}
+
+    def bound(node):
+        if node not in bounds:
+            bounds[node] = float(haversine(G.nodes[node]['x'], G.nodes[node]['y'], end['x'], end['y']))
+        return bounds[node]
+
+    return bound
+
+def pareto_alternatives(G, source_point, dest_point, max_routes=5, epsilon=0.05, max_labels=8, pareto_adj=None):
+    # routes trading length against optimality, shortest first; see utils/pareto.py.
+    # without pareto_adj the optimality is G's 'optimal' edge attribute
+    if pareto_adj is None:
+        u, v, key, length, optimal = zip(*(
+            (u, v, key, d['length'], d.get('optimal', np.nan)) for u, v, key, d in G.edges(keys=True, data=True)
+        ))
+        pareto_adj = build_pareto_adjacency({'u': u, 'v': v, 'key': key, 'length': length, 'optimal': optimal})
+    routes = pareto_paths(
+        pareto_adj, source_point, dest_point, epsilon=epsilon, max_labels=max_labels, max_routes=max_routes,
+        lower_bound=remaining_length_bound(G, dest_point),
     )
-    return path_shortest, path_practical, bbox_practical
-
-def get_path_details(path):
-    length = get_path_length(path)
-    optimality = get_path_optimality(path)
+    return [path for path, _, _ in routes]
+
+def get_shortest_and_optimal_paths(G, source_point, dest_point, corridor_padding_percent=0.20, max_depth=50,
+                                   csr=None, node_grid=None, alternatives=0, epsilon=0.05, max_labels=8, pareto_adj=None,
+                                   progress=None, weights=None):
+    # with alternatives > 0, up to that many Pareto routes are returned as well.
+    # weights is the corridor search's per-edge optimality, see optimal_path_in_corridor.
+    # progress(stage) is called as each stage starts (see utils/jobs.py)
+    progress = progress or _no_progress
+    if csr is None:
+        csr = graph_csr(G)
+    progress('shortest')
+    with metrics.timer('shortest'):
+        path_shortest = shortest_hop_path(csr, source_point, dest_point)
+    if path_shortest is None:
+        raise nx.NetworkXNoPath(f'No path between {source_point} and {dest_point}.')
+    progress('corridor search')
+    with metrics.timer('corridor search'):
+        path_practical, optimality_practical, bbox_practical = optimal_path_in_corridor(
+            G, source_point, dest_point, path_shortest,
+            corridor_padding_percent=corridor_padding_percent, max_depth=max_depth,
+            csr=csr, node_grid=node_grid, weights=weights,
+        )
+    if not alternatives:
+        return path_shortest, path_practical, bbox_practical
+
+    progress('alternatives')
+    with metrics.timer('alternatives'):
+        paths_pareto = pareto_alternatives(
+            G, source_point, dest_point, max_routes=alternatives,
+            epsilon=epsilon, max_labels=max_labels, pareto_adj=pareto_adj,
+        )
+    return path_shortest, path_practical, bbox_practical, paths_pareto
+
+def get_path_details(path, context=None):
+    length = get_path_length(path, context)
+    optimality = get_path_optimality(path, context)
 
     safety_array = ['empty', 'safe', 'caution', 'many caution'][::-1]
     safety = safety_array[math.floor(len(safety_array) * optimality)]
@@ -171,26 +198,93 @@ def get_path_details(path):
         'safety': safety,
     }
 
-def get_nearest_node(G, query):
+def geocode_both(source_query, dest_query, geocoder=None):
+    # both queries at once, so two Nominatim fallbacks wait on the network together
+    geocoder = default_geocoder if geocoder is None else geocoder
+    source_location, dest_location = _geocode_pool.map(geocoder.geocode, (source_query, dest_query))
+    for query, location in ((source_query, source_location), (dest_query, dest_location)):
+        if location is None:
+            raise ValueError(f'no location found for {query!r}')
+    return source_location, dest_location
+
+def get_nearest_node(G, query, geocoder=None):
+    geocoder = default_geocoder if geocoder is None else geocoder
     try:
-        lat, lon = ox.geocode(query)
-        return ox.distance.nearest_nodes(G, lon, lat)
+        location = geocoder.geocode(query)
+        if location is None:
+            raise ValueError(f'no location found for {query!r}')
+        lat, lon = location
+        return snap_points(data.snapper, [lat], [lon])[0].item()
     except Exception as e:
-        print(f"Geocoding failed: {e}")
+        logger.warning('Geocoding %r failed: %s', query, e)
         return None
 
-def generate_map(source_query, dest_query):
-    source_point = get_nearest_node(G, source_query)
-    dest_point = get_nearest_node(G, dest_query)
-    print(f"Source node: {source_point}, Destination node: {dest_point}")
-
-    optimal_df = features[['optimal']]
-    path_shortest, path_practical, bbox_practical = get_shortest_and_optimal_paths(
-        G, optimal_df, source_point, dest_point
+def compute_route(source_point, dest_point, corridor_padding_percent=0.20, max_depth=50, alternatives=0, context=None,
+                  progress=None, bucket=None):
+    # context defaults to the shared data context; utils/tiles.py passes a region's.
+    # with a departure bucket (see utils/time_costs.py) the optimal route uses that
+    # bucket's optimality; the details and the alternatives stay all-day
+    context = data if context is None else context
+    progress = progress or _no_progress
+    paths = get_shortest_and_optimal_paths(
+        context.G, source_point, dest_point,
+        corridor_padding_percent=corridor_padding_percent, max_depth=max_depth,
+        csr=context.csr, node_grid=context.node_grid,
+        alternatives=alternatives, pareto_adj=context.pareto_adjacency if alternatives else None,
+        progress=progress, weights=None if bucket is None else context.time_costs[:, bucket],
+    )
+    path_shortest, path_practical, bbox_practical = paths[:3]
+    if path_practical is None:
+        raise ValueError(f'No optimal path from {source_point} to {dest_point} within the corridor')
+
+    progress('details')
+    with metrics.timer('details'):
+        route = {
+            'path_shortest': path_shortest,
+            'path_practical': path_practical,
+            'bbox_practical': bbox_practical,
+            'path_shortest_details': get_path_details(path_shortest, context),
+            'path_practical_details': get_path_details(path_practical, context),
+        }
+        if alternatives:
+            route['paths_pareto'] = paths[3]
+            route['paths_pareto_details'] = [get_path_details(path, context) for path in paths[3]]
+    return route
+
+def get_route(source_point, dest_point, corridor_padding_percent=0.20, max_depth=50, cache=None, alternatives=0, context=None,
+              progress=None, departure=None):
+    # departure (an hour or a datetime) routes on that time of day's optimality,
+    # when the images give one; otherwise it is the all-day route
+    cache = route_cache if cache is None else cache
+    time_costs = None if departure is None else (data if context is None else context).time_costs
+    bucket = None if time_costs is None else departure_bucket(departure)
+    parts = (source_point, dest_point, corridor_padding_percent, max_depth, alternatives)
+    if bucket is not None:
+        parts += (('bucket', bucket),)
+    # the data version keeps routes cached on disk from outliving a rebuilt graph
+    # or optimal_features; a region only holds part of the network, so its routes
+    # are cached per region
+    parts += (('data', (data if context is None else context).data_version),)
+    key = cache.make_key(*parts) if context is None else cache.make_key(*parts, context.bbox)
+    return cache.get_or_compute(
+        key, lambda: compute_route(source_point, dest_point, corridor_padding_percent, max_depth, alternatives, context, progress,
+                                   bucket)
     )
-    path_shortest_details = get_path_details(path_shortest)
-    path_practical_details = get_path_details(path_practical)
 
+def get_tiled_route(source_latlon, dest_latlon, tiles, corridor_padding_percent=0.20, max_depth=50, cache=None, alternatives=0,
+                    departure=None):
+    # routes between two (lat, lon) points on the tiles around them (see utils/tiles.py)
+    # instead of the single-bbox network
+    context = tiles.region_for_points([source_latlon, dest_latlon])
+    (source_point, dest_point) = snap_points(
+        context.snapper, [source_latlon[0], dest_latlon[0]], [source_latlon[1], dest_latlon[1]]
+    ).tolist()
+    route = get_route(source_point, dest_point, corridor_padding_percent, max_depth, cache, alternatives, context,
+                      departure=departure)
+    return context, route
+
+def build_base_map():
+    # tiles only; routes are drawn over it as layers, so the app can build it once
     m = folium.Map(
         location=[sum((north, south)) / 2, sum((east, west)) / 2],
         zoom_start=16,
@@ -210,93 +304,137 @@ def generate_map(source_query, dest_query):
         opacity=0.2,
         overlay=False
     ).add_to(m)
-    folium.LayerControl().add_to(m)
-
-    # rectangle_bounds = [[min(north, south), min(east, west)], [max(north, south), max(east, west)]]
-
-    # folium.Rectangle(
-    #     bounds=rectangle_bounds,
-    #     color=None,
-    #     fill=True,
-    #     fill_color='#eb4d4b',
-    #     fill_opacity=0.2,
-    # ).add_to(m)
+    return m
+
+def get_path_geometry(path, tolerance_m=SIMPLIFY_TOLERANCE_M, context=None):
+    # the path's edges merged into as few lines as possible, simplified to within
+    # tolerance_m and rounded to about 10 cm
+    context = data if context is None else context
+    geoms = context.roads_gdf.geometry.to_numpy()[get_path_rows(path, context)]
+    merged = shapely.line_merge(shapely.multilinestrings(geoms))
+    return shapely.set_precision(shapely.simplify(merged, tolerance_m / METERS_PER_DEGREE), 1e-6)
+
+def path_feature(path, name=None, properties=None, context=None):
+    # one GeoJSON feature for the whole path instead of a PolyLine per edge
+    return {
+        'type': 'Feature',
+        'geometry': shapely.geometry.mapping(get_path_geometry(path, context=context)),
+        'properties': {'name': name, **(properties or {})},
+    }
 
+def draw_path(layer, path, color='cornflowerblue', name=None, context=None):
+    feature = path_feature(path, name, context=context)
+    folium.GeoJson(
+        feature,
+        name=name,
+        style_function=lambda _: {'color': color, 'weight': 5, 'opacity': 0.7},
+        tooltip=name,
+    ).add_to(layer)
+    return layer
+
+def build_route_layers(route, source_point, dest_point, context=None):
+    # the two routes and their end points in one layer, plus a hidden layer per
+    # Pareto alternative when the route has them
+    context = data if context is None else context
+    nodes_gdf = context.nodes_gdf
+
+    layer = folium.FeatureGroup(name='Routes')
     # folium.Rectangle(
     #     bounds=[[bbox_practical[1], bbox_practical[0]], [bbox_practical[3], bbox_practical[2]]],
     #     color=None,
     #     fill=True,
     #     fill_color='#f39c12',
     #     fill_opacity=0.2,
-    # ).add_to(m)
+    # ).add_to(layer)
 
-    points_list = [(nodes_gdf.loc[source_point, 'y'], nodes_gdf.loc[source_point, 'x']),
-                 (nodes_gdf.loc[dest_point, 'y'], nodes_gdf.loc[dest_point, 'x'])]
-    for coords in points_list:
+    for point in (source_point, dest_point):
         folium.CircleMarker(
-            location=coords,
+            location=(nodes_gdf.loc[point, 'y'], nodes_gdf.loc[point, 'x']),
             radius=2,
             color="#4834d4",
-        ).add_to(m)
-
-    def draw_path(m, path_to_plot, color='cornflowerblue'):
-        for source_osmid, dest_osmid in nx.utils.pairwise(path_to_plot):
-            if (source_osmid, dest_osmid, 0) in roads_gdf.index:
-                row = roads_gdf.loc[(source_osmid, dest_osmid, 0)]
-            elif (dest_osmid, source_osmid, 0) in roads_gdf.index:
-                row = roads_gdf.loc[(dest_osmid, source_osmid, 0)]
-            else:
-                print(f'Edge between {source_osmid} and {dest_osmid} not found')
-                continue
-
-            folium.PolyLine(
-                locations=[(lat, lon) for lon, lat in row['geometry'].coords],
-                color=color,
-                weight=5,
-                opacity=0.7,
-            ).add_to(m)
-
-        return m
-
-    m = draw_path(m, path_shortest, color='#e74c3c')
-    m = draw_path(m, path_practical, color='#0984e3')
-
-    return m, path_shortest, path_practical, path_shortest_details, path_practical_details
+        ).add_to(layer)
+
+    draw_path(layer, route['path_shortest'], color='#e74c3c', name='Shortest route', context=context)
+    draw_path(layer, route['path_practical'], color='#0984e3', name='Optimal route', context=context)
+    layers = [layer]
+
+    for i, (path, details) in enumerate(zip(route.get('paths_pareto', ()), route.get('paths_pareto_details', ()))):
+        name = f"Alternative {i + 1}: {round(details['length_m'] / 1000, 1)} km, {details['safety']}"
+        layers.append(draw_path(folium.FeatureGroup(name=name, show=False), path, color='#6c5ce7', name=name, context=context))
+
+    return layers
+
+def route_geojson(route, source_point, dest_point, context=None):
+    # the route as a GeoJSON FeatureCollection, for callers without folium (see
+    # utils/service.py): both end points, then the shortest, the optimal and any
+    # alternative routes with their details as properties
+    context = data if context is None else context
+    nodes_gdf = context.nodes_gdf
+
+    features = [
+        {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [float(nodes_gdf.loc[point, 'x']), float(nodes_gdf.loc[point, 'y'])]},
+            'properties': {'name': name, 'node': int(point)},
+        }
+        for name, point in (('source', source_point), ('destination', dest_point))
+    ]
+    features.append(path_feature(route['path_shortest'], 'shortest', route['path_shortest_details'], context))
+    features.append(path_feature(route['path_practical'], 'optimal', route['path_practical_details'], context))
+    for i, (path, details) in enumerate(zip(route.get('paths_pareto', ()), route.get('paths_pareto_details', ()))):
+        features.append(path_feature(path, f'alternative {i + 1}', details, context))
+
+    return {'type': 'FeatureCollection', 'features': features}
+
+def find_route(source_query, dest_query, cache=None, alternatives=0, progress=None, departure=None):
+    # geocodes and snaps both ends, then gets the route between the two nodes;
+    # returns (source node, destination node, route)
+    progress = progress or _no_progress
+
+    progress('geocode')
+    with metrics.timer('geocode'):
+        (source_lat, source_lon), (dest_lat, dest_lon) = geocode_both(source_query, dest_query)
+    progress('snap')
+    with metrics.timer('snap'):
+        source_point, dest_point = snap_points(data.snapper, [source_lat, dest_lat], [source_lon, dest_lon]).tolist()
+    logger.debug('Source node: %s, Destination node: %s', source_point, dest_point)
+
+    route = get_route(source_point, dest_point, cache=cache, alternatives=alternatives, progress=progress,
+                      departure=departure)
+    return source_point, dest_point, route
+
+def generate_map(source_query, dest_query, cache=None, alternatives=0, as_layers=False, progress=None, departure=None):
+    # with alternatives > 0 the Pareto routes are drawn as layers that start hidden,
+    # and returned with their details after the usual values. with as_layers the
+    # first value is the list of route layers (see build_route_layers) to draw over
+    # a base map the caller keeps, instead of a whole map. departure is passed on
+    # to get_route. every stage is timed in utils.metrics as well (see benchmarks/bench_routing.py)
+    progress = progress or _no_progress
+
+    with metrics.timer('generate_map'):
+        source_point, dest_point, route = find_route(source_query, dest_query, cache, alternatives, progress, departure)
+        path_shortest, path_practical = route['path_shortest'], route['path_practical']
+        path_shortest_details, path_practical_details = route['path_shortest_details'], route['path_practical_details']
+
+        progress('render')
+        with metrics.timer('render'):
+            m = build_route_layers(route, source_point, dest_point)
+            if not as_layers:
+                base = build_base_map()
+                for layer in m:
+                    layer.add_to(base)
+                folium.LayerControl().add_to(base)
+                m = base
+
+    if not alternatives:
+        return m, path_shortest, path_practical, path_shortest_details, path_practical_details
+
+    return (m, path_shortest, path_practical, path_shortest_details, path_practical_details,
+            route['paths_pareto'], route['paths_pareto_details'])
 
 # for getting images along the path
-def sort_image_ids(image_id, source_osmid):
-    source_coords = (nodes_gdf.loc[source_osmid, 'y'].item(), nodes_gdf.loc[source_osmid, 'x'].item()) # lat, lon
-    image_coords = images_matches.loc[image_id, 'geometry'].coords[0][::-1]
-
-    distance = great_circle(source_coords, image_coords)
-    return distance.meters
-
 def get_image_ids(path):
-    image_ids = []
-    osmid_to_image_id = images_matches.reset_index(drop=False).groupby('osmid').agg({ 'image_id': list })
-
-    prev_image_ids = []
-
-    for source_osmid, dest_osmid in nx.utils.pairwise(path):
-        if (source_osmid, dest_osmid, 0) in roads_gdf.index:
-            edge_osmid = roads_gdf.loc[(source_osmid, dest_osmid, 0), 'osmid']
-        elif (dest_osmid, source_osmid, 0) in roads_gdf.index:
-            edge_osmid = roads_gdf.loc[(dest_osmid, source_osmid, 0), 'osmid']
-        else:
-            print(f'Edge between {source_osmid} and {dest_osmid} not found')
-            continue
-
-        egde_osmid = edge_osmid.item()
-
-        if edge_osmid in osmid_to_image_id.index:
-            curr_image_ids = osmid_to_image_id.loc[edge_osmid].item()
-
-            if curr_image_ids != prev_image_ids:
-                curr_image_ids = sorted(curr_image_ids, key=lambda x: sort_image_ids(x, source_osmid))
-                image_ids.extend([curr_image_ids[0], curr_image_ids[-1]])
-                prev_images_ids = curr_image_ids
-
-    return image_ids
+    return route_image_ids(data.image_index, data.edge_index, data.edge_weights, path)
 
 def evenly_sample(input_list, n):
     if n <= 0:
@@ -316,7 +454,12 @@ def evenly_sample(input_list, n):
     return [input_list[i] for i in indices]
 
 def get_image_to_url(image_id):
-    return image_to_url.loc[image_id, 'url']
+    return data.image_to_url.loc[image_id, 'url']
+
+def get_image_urls(image_ids):
+    # None for images without a url
+    urls = data.image_to_url['url'].reindex(image_ids)
+    return [url if isinstance(url, str) else None for url in urls]
 
 if __name__ == '__main__':
     generate_map(5283414945, 3604556047).save('test_map.html')
@@ -0,0 +1,202 @@
+import numpy as np
+from collections import deque
+
+from utils.metrics import metrics
+
+# label-setting search for the simple path with the highest mean edge optimality.
+#
+# labels are appended to flat lists and point at their parent label, so a path is
+# never copied while searching. labels are expanded level by level (one level per
+# hop), and each label carries the nodes of its path as a bitmask. the search
+# starts from the fewest-hop path, so there is always a best mean to beat, and
+# labels are compared by their potential, running total - hops * best mean. a
+# node drops a new label only when one of its labels has an equal or higher
+# potential, no more hops and a subset of the new label's nodes: any ending the
+# new label can still take is then open to that label too, and if it beats the
+# best mean after the new label, it does so by more after the kept one. a best
+# potential alone is not enough, since its path may block the ending the other
+# label needs.
+#
+# max_depth is the detour budget: a path may use at most max_depth more edges
+# than the fewest-hop path from start to end.
+#
+# the problem is NP-hard, and on a street grid with a long detour budget the
+# non-dominated labels grow exponentially, so a node keeps at most max_labels of
+# them. once it is full a new label has to beat all their potentials, and
+# replaces the lowest. the search is exact while no node hits the cap; once one
+# does (counted in search.capped_labels) the result is the best path among the
+# labels kept, not necessarily the best one. on the grids of
+# benchmarks/bench_max_avg.py more labels per node buy well under 0.1% of mean
+# optimality for 2-4x the time, so a node keeps one.
+
+MAX_LABELS = 1
+
+
+def build_adjacency(G, edge_weights):
+    # edges without a weight are left out, so the search never crosses them
+    adj = {node: [] for node in G.nodes()}
+    for u, v in dict.fromkeys(G.edges()):
+        weight = edge_weights.get((u, v), np.nan)
+        if np.isnan(weight):
+            continue
+        adj[u].append((v, weight))
+    return adj
+
+
+def hops_to_target(adj, end, stop_at=None, max_extra=0):
+    reverse = {}
+    for u, nbrs in adj.items():
+        for v, _ in nbrs:
+            reverse.setdefault(v, []).append(u)
+
+    dist = {end: 0}
+    queue = deque([end])
+    limit = np.inf
+
+    while queue:
+        current = queue.popleft()
+        if dist[current] >= limit:
+            break
+        for prev in reverse.get(current, ()):
+            if prev in dist:
+                continue
+            dist[prev] = dist[current] + 1
+            if prev == stop_at:
+                limit = dist[prev] + max_extra
+            queue.append(prev)
+
+    return dist
+
+
+def _label_path(label, label_node, label_parent):
+    path = []
+    while label >= 0:
+        path.append(label_node[label])
+        label = label_parent[label]
+    return path[::-1]
+
+
+def _seed_path(adj, start, dist):
+    # the fewest-hop path that takes the best edge at every step, a first lower
+    # bound for the search. every node dist reaches has an edge one hop closer
+    path, total = [start], 0.0
+    while dist[path[-1]]:
+        weight, neighbor = max(
+            (weight, neighbor) for neighbor, weight in adj[path[-1]] if dist.get(neighbor) == dist[path[-1]] - 1
+        )
+        path.append(neighbor)
+        total += weight
+    return path, total / (len(path) - 1)
+
+
+def max_avg_path(adj, start, end, max_depth=50, dist=None, w_max=None, max_labels=MAX_LABELS):
+    # dist (hops to end) and w_max (the largest weight in adj) are computed from
+    # adj unless the caller has them cheaper. max_labels=None keeps every
+    # non-dominated label
+    max_labels = np.inf if max_labels is None else max_labels
+    if start == end:
+        return [start], 0.0
+
+    if dist is None:
+        dist = hops_to_target(adj, end, stop_at=start, max_extra=max_depth)
+    if start not in dist:
+        return None, -np.inf
+
+    depth_limit = dist[start] + max_depth
+    if w_max is None:
+        w_max = max((w for nbrs in adj.values() for _, w in nbrs), default=0.0)
+
+    best_path, best_avg = _seed_path(adj, start, dist)
+    best_label = -1
+
+    # each node gets a bit the first time a label reaches it
+    bit = {start: 1}
+    label_node, label_parent, label_total, label_count, label_mask = [start], [-1], [0.0], [0], [1]
+    node_labels = {start: [0]}
+    capped = expanded = pushes = 0
+
+    frontier = [0]
+    for count in range(1, depth_limit + 1):
+        remaining = depth_limit - count
+        next_frontier, dropped = [], set()
+
+        for label in frontier:
+            node, total, mask = label_node[label], label_total[label], label_mask[label]
+            if mask is None:
+                # replaced at its node by a label of this level before its turn
+                continue
+            expanded += 1
+            if max_labels == 1:
+                # a lone label is never compared by its nodes, so its mask is
+                # only needed to expand it
+                label_mask[label] = None
+
+            for neighbor, weight in adj[node]:
+                hops_left = dist.get(neighbor)
+                if hops_left is None or hops_left > remaining:
+                    continue
+
+                neighbor_bit = bit.get(neighbor)
+                if neighbor_bit is None:
+                    neighbor_bit = bit[neighbor] = 1 << len(bit)
+                elif mask & neighbor_bit:
+                    continue
+
+                new_total = total + weight
+
+                # optimistic completion: every remaining edge has the best weight,
+                # over the fewest or the most edges the budget leaves
+                extra = remaining if w_max * count > new_total else hops_left
+                if (new_total + extra * w_max) / (count + extra) <= best_avg:
+                    continue
+
+                new_mask = mask | neighbor_bit
+                potential = new_total - count * best_avg
+                labels = node_labels.get(neighbor)
+                if labels is None:
+                    labels = node_labels[neighbor] = []
+                else:
+                    potentials = [label_total[other] - label_count[other] * best_avg for other in labels]
+                    if potential <= max(potentials):
+                        if len(labels) >= max_labels:
+                            capped += 1
+                            continue
+                        if any(p >= potential and label_mask[other] | new_mask == new_mask
+                               for other, p in zip(labels, potentials)):
+                            continue
+                    elif len(labels) >= max_labels:
+                        worst = labels[potentials.index(min(potentials))]
+                        labels.remove(worst)
+                        label_mask[worst] = None
+                        dropped.add(worst)
+                        capped += 1
+
+                label_node.append(neighbor)
+                label_parent.append(label)
+                label_total.append(new_total)
+                label_count.append(count)
+                label_mask.append(new_mask)
+                new_label = len(label_node) - 1
+                labels.append(new_label)
+
+                if neighbor == end:
+                    if new_total / count > best_avg:
+                        best_label, best_avg = new_label, new_total / count
+                    continue
+
+                next_frontier.append(new_label)
+                pushes += 1
+
+        # a label dropped in the level it was made in is never expanded
+        frontier = [label for label in next_frontier if label not in dropped]
+        if not frontier:
+            break
+
+    metrics.count('search.labels', len(label_node))
+    metrics.count('search.expanded', expanded)
+    metrics.count('search.pushes', pushes)
+    if capped:
+        metrics.count('search.capped_labels', capped)
+    if best_label >= 0:
+        best_path = _label_path(best_label, label_node, label_parent)
+    return best_path, best_avg
@@ -0,0 +1,319 @@
+import json
+import asyncio
+import logging
+import argparse
+import signal
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import networkx as nx
+
+from utils.context import data, warm_up
+from utils.routing import find_route, route_geojson, get_image_ids, get_image_urls, evenly_sample
+from utils.metrics import metrics
+from utils.geocoding import GeocoderError, GeocoderUnavailable
+from utils.time_costs import departure_bucket
+
+# routing over HTTP without Streamlit or folium. the server is a small asyncio
+# HTTP/1.1 loop (keep-alive, JSON in and out); routes are computed in a pool of
+# worker processes that each load the graph once, so the event loop only parses
+# requests and waits. concurrent requests for the same query share one
+# computation instead of each taking a worker.
+#
+#   GET  /health                         liveness, in-flight queries and metrics
+#   GET  /route?source=..&destination=.. also POST with a JSON body; optional
+#                                        alternatives (0-5) and departure (hour or
+#                                        ISO datetime, see utils/time_costs.py)
+#   POST /routes/batch                   {"queries": [<route query>, ...]}
+#   GET  /images?source=..&destination=.. images along the route; optional route
+#                                        (optimal or shortest) and limit
+#
+# routes come back as a GeoJSON FeatureCollection (see utils.routing.route_geojson).
+#
+#   python -m utils.service --port 8080 --workers 4
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 1 << 20
+MAX_BATCH = 100
+MAX_ALTERNATIVES = 5
+WARM_DATASETS = ('network', 'node_grid', 'snapper', 'gazetteer')
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+           500: 'Internal Server Error', 502: 'Bad Gateway', 503: 'Service Unavailable'}
+
+
+class BadRequest(Exception):
+    pass
+
+
+# worker processes
+def _init_worker(graph_path):
+    data.graph_path = graph_path
+    warm_up(*WARM_DATASETS)
+
+
+def route_query(query):
+    source_point, dest_point, route = find_route(
+        query['source'], query['destination'], alternatives=query['alternatives'], departure=query['departure']
+    )
+    return {
+        'source_node': source_point,
+        'destination_node': dest_point,
+        'routes': route_geojson(route, source_point, dest_point),
+    }
+
+
+def images_query(query):
+    _, _, route = find_route(query['source'], query['destination'], departure=query['departure'])
+    path = route['path_practical'] if query['route'] == 'optimal' else route['path_shortest']
+    image_ids = evenly_sample(list(get_image_ids(path)), query['limit'])
+    return {
+        'route': query['route'],
+        'images': [{'image_id': int(image_id), 'url': url} for image_id, url in zip(image_ids, get_image_urls(image_ids))],
+    }
+
+
+# request parsing
+def _int_param(params, name, default, low, high):
+    value = params.get(name, default)
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise BadRequest(f'{name} must be an integer') from None
+    if not low <= value <= high:
+        raise BadRequest(f'{name} must be between {low} and {high}')
+    return value
+
+
+def parse_route_query(params):
+    # the fields that decide the result, normalized so identical queries coalesce
+    query = {}
+    for name in ('source', 'destination'):
+        value = params.get(name)
+        if not isinstance(value, str) or not value.strip():
+            raise BadRequest(f'{name} is required')
+        query[name] = value.strip()
+    query['alternatives'] = _int_param(params, 'alternatives', 0, 0, MAX_ALTERNATIVES)
+
+    departure = params.get('departure')
+    if departure is not None:
+        if isinstance(departure, bool):
+            raise BadRequest('departure must be an hour or an ISO datetime')
+        if isinstance(departure, str) and departure.replace('.', '', 1).isdigit():
+            departure = float(departure)
+        try:
+            # the bucket stands in for the time; as an hour it maps back to itself
+            departure = departure_bucket(departure)
+        except (TypeError, ValueError):
+            raise BadRequest('departure must be an hour or an ISO datetime') from None
+    query['departure'] = departure
+    return query
+
+
+def parse_images_query(params):
+    query = parse_route_query(params)
+    del query['alternatives']
+    query['route'] = params.get('route', 'optimal')
+    if query['route'] not in ('optimal', 'shortest'):
+        raise BadRequest('route must be optimal or shortest')
+    query['limit'] = _int_param(params, 'limit', 0, 0, 10_000)
+    return query
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+class RoutingService:
+    # workers=0 computes in threads of this process instead, on the shared data context
+    def __init__(self, workers=4, graph_path=None):
+        graph_path = data.graph_path if graph_path is None else graph_path
+        if workers:
+            self.executor = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(graph_path,))
+        else:
+            data.graph_path = graph_path
+            self.executor = ThreadPoolExecutor(4, thread_name_prefix='route')
+        self.workers = workers
+        self._in_flight = {}
+        self.routes = {
+            ('GET', '/health'): self.health,
+            ('GET', '/route'): self.route,
+            ('POST', '/route'): self.route,
+            ('POST', '/routes/batch'): self.batch,
+            ('GET', '/images'): self.images,
+            ('POST', '/images'): self.images,
+        }
+
+    async def start(self, host='127.0.0.1', port=8080):
+        # every worker loads the graph before the first request is accepted
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.executor, warm_up, *WARM_DATASETS)
+                               for _ in range(max(self.workers, 1))))
+        return await asyncio.start_server(self.handle, host, port)
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    async def compute(self, fn, query):
+        # identical queries in flight share one computation; shield keeps one
+        # client going away from cancelling it for the others
+        key = (fn.__name__, json.dumps(query, sort_keys=True))
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(asyncio.get_running_loop().run_in_executor(self.executor, fn, query))
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            metrics.count('service.coalesced')
+        return await asyncio.shield(future)
+
+    # endpoints: params -> JSON-able result
+    async def health(self, params):
+        return {'status': 'ok', 'workers': self.workers, 'in_flight': len(self._in_flight), 'metrics': metrics.summary()}
+
+    async def route(self, params):
+        return await self.compute(route_query, parse_route_query(params))
+
+    async def images(self, params):
+        return await self.compute(images_query, parse_images_query(params))
+
+    async def batch(self, params):
+        queries = params.get('queries')
+        if not isinstance(queries, list) or not queries:
+            raise BadRequest('queries must be a non-empty list')
+        if len(queries) > MAX_BATCH:
+            raise BadRequest(f'at most {MAX_BATCH} queries per batch')
+
+        async def one(params):
+            if not isinstance(params, dict):
+                return {'status': 400, 'error': 'each query must be an object'}
+            status, result = await self.respond(self.route, params)
+            return {'status': status, **(result if status != 200 else {'result': result})}
+
+        return {'results': await asyncio.gather(*(one(params) for params in queries))}
+
+    async def respond(self, endpoint, params):
+        # (status, body) for an endpoint call; routing failures are 404s, and a
+        # geocoder that is down or failing is the upstream's error, not the query's
+        try:
+            return 200, await endpoint(params)
+        except BadRequest as e:
+            return 400, {'error': str(e)}
+        except GeocoderUnavailable as e:
+            return 503, {'error': str(e)}
+        except GeocoderError as e:
+            return 502, {'error': str(e)}
+        except (ValueError, KeyError, nx.NetworkXNoPath, nx.NodeNotFound) as e:
+            return 404, {'error': str(e)}
+        except Exception as e:
+            logger.exception('%s failed', getattr(endpoint, '__name__', endpoint))
+            return 500, {'error': f'{type(e).__name__}: {e}'}
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        endpoint = self.routes.get((method, url.path))
+        if endpoint is None:
+            allowed = any(path == url.path for _, path in self.routes)
+            return (405, {'error': f'{method} not allowed'}) if allowed else (404, {'error': f'no endpoint {url.path}'})
+
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        if body:
+            try:
+                body = json.loads(body)
+            except ValueError:
+                return 400, {'error': 'body is not valid JSON'}
+            if not isinstance(body, dict):
+                return 400, {'error': 'body must be a JSON object'}
+            params.update(body)
+
+        metrics.count('service.requests')
+        with metrics.timer(f'service {url.path}'):
+            return await self.respond(endpoint, params)
+
+    async def handle(self, reader, writer):
+        # one connection; requests on it are answered in order until it closes
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._send(writer, 400, {'error': 'malformed request line'}, keep_alive=False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                # without a valid length the body cannot be skipped, so the connection closes
+                length = headers.get('content-length') or '0'
+                if not length.isascii() or not length.isdigit():
+                    await self._send(writer, 400, {'error': 'invalid Content-Length'}, keep_alive=False)
+                    break
+                length = int(length)
+                if length > MAX_BODY_BYTES:
+                    await self._send(writer, 413, {'error': f'body over {MAX_BODY_BYTES} bytes'}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                status, result = await self.dispatch(method.upper(), target, body)
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                await self._send(writer, status, result, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _send(writer, status, result, keep_alive):
+        body = json.dumps(result, default=_json_default).encode()
+        head = (
+            f'HTTP/1.1 {status} {REASONS.get(status, "")}\r\n'
+            f'Content-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+
+async def serve(host, port, workers, graph_path=None):
+    service = RoutingService(workers, graph_path)
+    server = await service.start(host, port)
+    print(f'Routing service on http://{host}:{port} with {workers or "in-process"} workers')
+
+    # stop on SIGTERM as on ctrl-c, so the worker processes are shut down too
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        asyncio.get_running_loop().add_signal_handler(signum, stop.set)
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve routes over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=4, help='worker processes; 0 routes in this process')
+    parser.add_argument('--graph-path', help='graph snapshot to load instead of the default one')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve(args.host, args.port, args.workers, args.graph_path))
@@ -0,0 +1,93 @@
+import numpy as np
+import shapely
+from scipy.spatial import cKDTree
+
+from utils.geodesic import EARTH_RADIUS_M
+
+# nearest node / nearest edge lookups for whole arrays of points. coordinates are
+# projected to local meters (equirectangular around the graph's mean latitude,
+# accurate to well under a meter across a city) so the trees work in meters.
+#
+# routes start and end at snap_points: the nearer end of the street a point lies
+# on, rather than the nearest node, which may be on a street a block away. a point
+# further than MAX_SNAP_M from every street is outside the network.
+
+MAX_SNAP_M = 300
+
+
+def _project(snapper, lats, lons):
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    return np.column_stack([EARTH_RADIUS_M * snapper['cos_lat0'] * lons, EARTH_RADIUS_M * lats])
+
+
+def _unproject(snapper, xy):
+    lons = np.degrees(xy[:, 0] / (EARTH_RADIUS_M * snapper['cos_lat0']))
+    lats = np.degrees(xy[:, 1] / EARTH_RADIUS_M)
+    return lats, lons
+
+
+def build_snapper(nodes_gdf, roads_gdf):
+    snapper = {'cos_lat0': float(np.cos(np.radians(nodes_gdf['y'].mean())))}
+
+    snapper['node_ids'] = nodes_gdf.index.to_numpy()
+    snapper['node_tree'] = cKDTree(_project(snapper, nodes_gdf['y'].to_numpy(), nodes_gdf['x'].to_numpy()))
+
+    edge_geoms = shapely.transform(
+        roads_gdf.geometry.to_numpy(),
+        lambda coords: _project(snapper, coords[:, 1], coords[:, 0]),
+    )
+    snapper['edge_geoms'] = edge_geoms
+    snapper['edge_tree'] = shapely.STRtree(edge_geoms)
+    snapper['edge_u'] = roads_gdf.index.get_level_values(0).to_numpy()
+    snapper['edge_v'] = roads_gdf.index.get_level_values(1).to_numpy()
+
+    return snapper
+
+
+def nearest_nodes(snapper, lats, lons, return_dist=False):
+    distances, positions = snapper['node_tree'].query(_project(snapper, lats, lons))
+    node_ids = snapper['node_ids'][positions]
+    return (node_ids, distances) if return_dist else node_ids
+
+
+def nearest_edges(snapper, lats, lons):
+    # for each point: the nearest edge row, the distance to it in meters, how far
+    # along the edge the snapped point lies (0 at u, 1 at v) and its lat/lon
+    points = shapely.points(_project(snapper, lats, lons))
+    (point_positions, rows), distances = snapper['edge_tree'].query_nearest(
+        points, return_distance=True, all_matches=False
+    )
+
+    order = np.argsort(point_positions)
+    rows, distances = rows[order], distances[order]
+    edges = snapper['edge_geoms'][rows]
+
+    fractions = shapely.line_locate_point(edges, points, normalized=True)
+    snapped = shapely.get_coordinates(shapely.line_interpolate_point(edges, fractions, normalized=True))
+    snapped_lats, snapped_lons = _unproject(snapper, snapped)
+
+    return {
+        'rows': rows,
+        'distance': distances,
+        'fraction': fractions,
+        'lat': snapped_lats,
+        'lon': snapped_lons,
+    }
+
+
+def snap_to_nodes(snapper, lats, lons):
+    # the end of each point's nearest edge the point is closer to along the edge,
+    # and the distance from the point to the edge in meters
+    edges = nearest_edges(snapper, lats, lons)
+    rows = edges['rows']
+    node_ids = np.where(edges['fraction'] < 0.5, snapper['edge_u'][rows], snapper['edge_v'][rows])
+    return node_ids, edges['distance']
+
+
+def snap_points(snapper, lats, lons, max_distance=MAX_SNAP_M):
+    node_ids, distances = snap_to_nodes(snapper, lats, lons)
+    for lat, lon, distance in zip(np.atleast_1d(lats), np.atleast_1d(lons), distances.tolist()):
+        if distance > max_distance:
+            raise ValueError(f'({lat}, {lon}) is {distance:.0f} m from the nearest street, more than {max_distance} m')
+    return node_ids
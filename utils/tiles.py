@@ -0,0 +1,215 @@
+import os
+import math
+import logging
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+import osmnx as ox
+from collections import OrderedDict
+
+from utils.graph_store import CACHE_DIR, GRAPH_DIR, NETWORK_TYPE, save_snapshot, snapshot_matches, load_snapshot_gdfs
+from utils.context import DataContext, build_network, data
+
+# the bike network as a grid of square lon/lat tiles instead of one bbox. each tile
+# is a graph snapshot of its own (see utils/graph_store.py), downloaded the first
+# time it is needed and read from disk after that. a route only loads the tiles
+# around its two ends: they are stitched into one region, which is routed on like
+# the single-bbox network. tiles and regions are kept in small LRUs, so memory
+# depends on how many parts of the city are in use, not on how much is covered.
+#
+# tiles overlap at their edges (a tile keeps every edge touching it), and OSM node
+# ids are global, so stitching is a de-duplicating concat.
+#
+#   python -m utils.tiles split                        tiles from the snapshot in GRAPH_DIR
+#   python -m utils.tiles download west south east north
+
+logger = logging.getLogger(__name__)
+
+TILES_DIR = os.path.join(CACHE_DIR, 'tiles')
+TILE_DEG = 0.01  # about 1.1 km north-south and 0.9 km east-west in Tokyo
+PADDING_DEG = 0.005  # regions reach this far past a route's ends
+
+
+def tile_bbox(key, tile_deg=TILE_DEG):
+    # (west, south, east, north)
+    ix, iy = key
+    return (ix * tile_deg, iy * tile_deg, (ix + 1) * tile_deg, (iy + 1) * tile_deg)
+
+
+def tile_keys(bbox, tile_deg=TILE_DEG):
+    # tiles touching bbox; its corners may come in either order (utils/graph_store.BBOX
+    # lists east first)
+    xs, ys = (bbox[0], bbox[2]), (bbox[1], bbox[3])
+    ix0, ix1 = math.floor(min(xs) / tile_deg), math.floor(max(xs) / tile_deg)
+    iy0, iy1 = math.floor(min(ys) / tile_deg), math.floor(max(ys) / tile_deg)
+    return [(ix, iy) for iy in range(iy0, iy1 + 1) for ix in range(ix0, ix1 + 1)]
+
+
+def download_tile(bbox):
+    G = ox.graph_from_bbox(bbox, network_type=NETWORK_TYPE, simplify=False, retain_all=True, truncate_by_edge=True)
+    return ox.graph_to_gdfs(G, nodes=True, edges=True)
+
+
+def split_into_tiles(nodes_gdf, roads_gdf, path=TILES_DIR, tile_deg=TILE_DEG, padding_deg=PADDING_DEG):
+    # every edge goes to the tiles of both its nodes, with both nodes; tiles of the
+    # network's bbox without edges, and those within padding_deg of it that a
+    # region padded around a route can reach, are written empty so they are not
+    # downloaded
+    xs, ys = nodes_gdf['x'], nodes_gdf['y']
+    node_tile = pd.Series(
+        list(zip(np.floor(xs / tile_deg).astype(int), np.floor(ys / tile_deg).astype(int))), index=nodes_gdf.index
+    )
+    u, v = roads_gdf.index.get_level_values(0), roads_gdf.index.get_level_values(1)
+    edge_tiles = pd.DataFrame({
+        'row': np.tile(np.arange(len(roads_gdf)), 2),
+        'tile': list(node_tile.loc[u]) + list(node_tile.loc[v]),
+    }).drop_duplicates()
+    rows_by_tile = edge_tiles.groupby('tile')['row'].apply(sorted)
+
+    keys = tile_keys(
+        (xs.min() - padding_deg, ys.min() - padding_deg, xs.max() + padding_deg, ys.max() + padding_deg), tile_deg
+    )
+    for key in keys:
+        rows = rows_by_tile.get(key, [])
+        tile_roads = roads_gdf.iloc[rows]
+        tile_nodes = nodes_gdf.loc[nodes_gdf.index.isin(u[rows]) | nodes_gdf.index.isin(v[rows])]
+        save_snapshot(tile_nodes, tile_roads, tile_bbox(key, tile_deg), _tile_path(path, key))
+    return keys
+
+
+def stitch(tiles):
+    nodes_gdf = pd.concat([nodes for nodes, _ in tiles])
+    roads_gdf = pd.concat([roads for _, roads in tiles])
+    nodes_gdf = nodes_gdf[~nodes_gdf.index.duplicated()]
+    roads_gdf = roads_gdf[~roads_gdf.index.duplicated()]
+
+    G = ox.graph_from_gdfs(nodes_gdf, roads_gdf, graph_attrs={'crs': str(nodes_gdf.crs)})
+    return G, nodes_gdf, roads_gdf
+
+
+def _tile_path(path, key):
+    return os.path.join(path, f'{key[0]}_{key[1]}')
+
+
+class TileStore:
+    # shared is the context whose features (and images, once loaded) regions reuse
+    def __init__(self, path=TILES_DIR, tile_deg=TILE_DEG, max_tiles=64, max_regions=4, padding_deg=PADDING_DEG,
+                 download=download_tile, shared=data):
+        self.path = path
+        self.tile_deg = tile_deg
+        self.max_tiles = max_tiles
+        self.max_regions = max_regions
+        self.padding_deg = padding_deg
+        self.download = download
+        self.shared = shared
+        self.tile_loads = 0
+        self.tile_downloads = 0
+        self._tiles = OrderedDict()
+        self._regions = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _remember(entries, key, value, maxsize):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > maxsize:
+            entries.popitem(last=False)
+
+    def tile(self, key, required=True):
+        # a tile that is not required (only padding around a route) and can be
+        # neither read nor downloaded is None, an empty tile
+        with self._lock:
+            if key in self._tiles:
+                self._tiles.move_to_end(key)
+                return self._tiles[key]
+
+        bbox, path = tile_bbox(key, self.tile_deg), _tile_path(self.path, key)
+        if snapshot_matches(bbox, path):
+            gdfs = load_snapshot_gdfs(path)
+            self.tile_loads += 1
+        else:
+            logger.info('No tile %s at %s, downloading', key, path)
+            try:
+                gdfs = self.download(bbox)
+            except Exception as e:
+                if required:
+                    raise
+                logger.warning('Could not download padding tile %s, leaving it out: %s', key, e)
+                return None
+            save_snapshot(*gdfs, bbox, path)
+            self.tile_downloads += 1
+
+        with self._lock:
+            self._remember(self._tiles, key, gdfs, self.max_tiles)
+        return gdfs
+
+    def region(self, bbox, required_bbox=None):
+        # the tiles of bbox stitched into one context; only those touching
+        # required_bbox (all of them by default) fail the region when missing
+        keys = tuple(tile_keys(bbox, self.tile_deg))
+        with self._lock:
+            if keys in self._regions:
+                self._regions.move_to_end(keys)
+                return self._regions[keys]
+
+        required = set(keys if required_bbox is None else tile_keys(required_bbox, self.tile_deg))
+        tiles = [self.tile(key, key in required) for key in keys]
+        G, nodes_gdf, roads_gdf = stitch([tile for tile in tiles if tile is not None])
+        west, south = tile_bbox(keys[0], self.tile_deg)[:2]
+        east, north = tile_bbox(keys[-1], self.tile_deg)[2:]
+
+        context = DataContext(bbox=(west, south, east, north), graph_path=None)
+        context.provide('features', self.shared.features)
+        for name in ('images_matches', 'image_to_url'):
+            if self.shared.is_loaded(name):
+                context.provide(name, getattr(self.shared, name))
+        context.provide('network', build_network(G, nodes_gdf, roads_gdf, context.features))
+
+        # a region missing a padding tile is rebuilt next time, when it may load
+        if all(tile is not None for tile in tiles):
+            with self._lock:
+                self._remember(self._regions, keys, context, self.max_regions)
+        return context
+
+    def region_for_points(self, points, padding_percent=0.20):
+        # the region around (lat, lon) points, padded so the route can detour
+        lats, lons = [lat for lat, _ in points], [lon for _, lon in points]
+        pad_lat = self.padding_deg + (max(lats) - min(lats)) * padding_percent
+        pad_lon = self.padding_deg + (max(lons) - min(lons)) * padding_percent
+        return self.region(
+            (min(lons) - pad_lon, min(lats) - pad_lat, max(lons) + pad_lon, max(lats) + pad_lat),
+            required_bbox=(min(lons), min(lats), max(lons), max(lats)),
+        )
+
+    def stats(self):
+        with self._lock:
+            return {
+                'tiles': len(self._tiles),
+                'max_tiles': self.max_tiles,
+                'regions': len(self._regions),
+                'max_regions': self.max_regions,
+                'tile_loads': self.tile_loads,
+                'tile_downloads': self.tile_downloads,
+            }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the tiled bike network.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('split', help=f'split the graph snapshot in {GRAPH_DIR} into tiles')
+    download = commands.add_parser('download', help='download every tile of a bbox')
+    for name in ('west', 'south', 'east', 'north'):
+        download.add_argument(name, type=float)
+    parser.add_argument('--tile-deg', type=float, default=TILE_DEG)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'split':
+        keys = split_into_tiles(*load_snapshot_gdfs(GRAPH_DIR), tile_deg=args.tile_deg)
+    else:
+        store = TileStore(tile_deg=args.tile_deg, max_tiles=1)
+        keys = tile_keys((args.west, args.south, args.east, args.north), args.tile_deg)
+        for key in keys:
+            store.tile(key)
+    logger.info('%d tiles in %s', len(keys), TILES_DIR)
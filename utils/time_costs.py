@@ -0,0 +1,155 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+
+from utils.graph_store import GRAPH_DIR
+from utils.edge_weights import features_fingerprint
+
+# optimality by time of day, from the pedestrians and vehicles the detector counted
+# in each street-level image. an edge's all-day optimality (from optimal_features)
+# is divided by how busy its ways are in a bucket compared to their all-day mean,
+# so a street that fills up in the evening scores lower then and higher at night.
+#
+# buckets are hours of the day in Tokyo time, taken from the images' captured_at
+# (milliseconds since the epoch, as Mapillary gives it). images without a capture
+# time count towards every bucket, so with no capture times at all every bucket is
+# the all-day optimality. each bucket is shrunk towards the way's all-day mean by
+# PRIOR_IMAGES pseudo-images, so one busy photo does not decide an hour.
+#
+# the table is (edge rows x buckets) float16, aligned with the rows of roads_gdf
+# like utils/edge_weights.py, and memory-mapped from the graph snapshot next to a
+# fingerprint of the features and detections it was built from.
+#
+#   python -m utils.time_costs
+
+logger = logging.getLogger(__name__)
+
+TIME_COSTS_PATH = os.path.join(GRAPH_DIR, 'time_costs')
+IMAGE_MATCHES_PATH = 'utils/datasets/image_matches_n_3_yolo.parquet'
+TIMEZONE = 'Asia/Tokyo'
+N_BUCKETS = 24
+PRIOR_IMAGES = 3
+
+
+def departure_bucket(departure, n_buckets=N_BUCKETS):
+    # an hour of the day (0-24) or a datetime; naive datetimes are Tokyo time
+    if isinstance(departure, (int, float, np.integer, np.floating)):
+        hour = float(departure) % 24
+    else:
+        departure = pd.Timestamp(departure)
+        if departure.tzinfo is not None:
+            departure = departure.tz_convert(TIMEZONE)
+        hour = departure.hour + departure.minute / 60
+    return int(hour * n_buckets // 24)
+
+
+def capture_buckets(images, n_buckets=N_BUCKETS):
+    # bucket of every image, -1 where the capture time is unknown
+    if 'captured_at' not in images:
+        return np.full(len(images), -1)
+    captured = images['captured_at']
+    if pd.api.types.is_numeric_dtype(captured):
+        captured = pd.to_datetime(captured, unit='ms', utc=True, errors='coerce')
+    else:
+        captured = pd.to_datetime(captured, utc=True, errors='coerce')
+    local = captured.dt.tz_convert(TIMEZONE)
+    hours = local.dt.hour + local.dt.minute / 60
+    return ((hours * n_buckets) // 24).fillna(-1).to_numpy(dtype=np.int64)
+
+
+def has_capture_times(images):
+    # without any, every bucket is the all-day optimality
+    return bool((capture_buckets(images) >= 0).any())
+
+
+def traffic_factors(images, n_buckets=N_BUCKETS, prior_images=PRIOR_IMAGES):
+    # (osmid x bucket): detections per image in the bucket over the all-day
+    # detections per image, both plus one so quiet ways stay finite
+    detections = images['pedestrians'].to_numpy(dtype=np.float64) + images['vehicles'].to_numpy(dtype=np.float64)
+    osmids, way = np.unique(images['osmid'].to_numpy(dtype=np.int64), return_inverse=True)
+    buckets = capture_buckets(images, n_buckets)
+    n_ways = len(osmids)
+
+    mean = np.bincount(way, detections, n_ways) / np.maximum(np.bincount(way, minlength=n_ways), 1)
+
+    timed = buckets >= 0
+    totals = np.zeros((n_ways, n_buckets))
+    counts = np.zeros((n_ways, n_buckets))
+    np.add.at(totals, (way[timed], buckets[timed]), detections[timed])
+    np.add.at(counts, (way[timed], buckets[timed]), 1)
+    totals += np.bincount(way[~timed], detections[~timed], n_ways)[:, None]
+    counts += np.bincount(way[~timed], minlength=n_ways)[:, None]
+
+    bucket_mean = (totals + prior_images * mean[:, None]) / (counts + prior_images)
+    return pd.DataFrame((bucket_mean + 1) / (mean[:, None] + 1), index=pd.Index(osmids, name='osmid'))
+
+
+def build_time_costs(roads_gdf, features, images, n_buckets=N_BUCKETS):
+    optimal = pd.to_numeric(features['optimal'], errors='coerce')
+    factors = traffic_factors(images, n_buckets).reindex(features.index).fillna(1.0)
+    way_table = factors.rdiv(optimal, axis=0).clip(0, 1)
+
+    # an edge can carry several osmids; each bucket is the mean of the known ones,
+    # as in utils/edge_weights.build_edge_weights
+    osmids = roads_gdf['osmid'].reset_index(drop=True).explode()
+    rows = way_table.reindex(osmids.to_numpy())
+    rows.index = osmids.index
+    table = rows.groupby(level=0).mean().reindex(range(len(roads_gdf)))
+    return table.to_numpy(dtype=np.float16)
+
+
+def _fingerprint(features, images, n_buckets=N_BUCKETS):
+    detections = images['pedestrians'].to_numpy(dtype=np.float64) + images['vehicles'].to_numpy(dtype=np.float64)
+    osmids = images['osmid'].to_numpy(dtype=np.int64)
+    buckets = capture_buckets(images, n_buckets)
+    return np.r_[
+        features_fingerprint(features),
+        len(images), detections.sum(), (detections * (osmids % 2**16)).sum(), (detections * buckets).sum(),
+    ]
+
+
+def save_time_costs(table, path=TIME_COSTS_PATH, fingerprint=None):
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, 'optimal.npy'), table)
+    if fingerprint is not None:
+        np.save(os.path.join(path, 'fingerprint.npy'), fingerprint)
+
+
+def load_time_costs(path=TIME_COSTS_PATH):
+    return np.load(os.path.join(path, 'optimal.npy'), mmap_mode='r')
+
+
+def _load_fingerprint(path):
+    fingerprint_path = os.path.join(path, 'fingerprint.npy')
+    return np.load(fingerprint_path) if os.path.exists(fingerprint_path) else None
+
+
+def load_or_build_time_costs(roads_gdf, features, images, path=TIME_COSTS_PATH, n_buckets=N_BUCKETS):
+    # path=None builds them without touching disk
+    if path is None:
+        return build_time_costs(roads_gdf, features, images, n_buckets)
+
+    fingerprint = _fingerprint(features, images, n_buckets)
+    if os.path.exists(os.path.join(path, 'optimal.npy')):
+        table = load_time_costs(path)
+        if table.shape == (len(roads_gdf), n_buckets) and np.array_equal(_load_fingerprint(path), fingerprint):
+            return table
+        logger.info('Time costs at %s do not match the graph, features or detections, rebuilding', path)
+
+    table = build_time_costs(roads_gdf, features, images, n_buckets)
+    save_time_costs(table, path, fingerprint)
+    return table
+
+
+if __name__ == '__main__':
+    from utils.context import data
+
+    logging.basicConfig(level=logging.INFO)
+
+    images = pd.read_parquet(IMAGE_MATCHES_PATH)
+    table = build_time_costs(data.roads_gdf, data.features, images)
+    save_time_costs(table, fingerprint=_fingerprint(data.features, images))
+    timed = int((capture_buckets(images) >= 0).sum())
+    logger.info('Saved %d buckets for %d edges to %s; %d of %d images have a capture time',
+                table.shape[1], table.shape[0], TIME_COSTS_PATH, timed, len(images))